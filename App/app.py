@@ -1,5 +1,6 @@
 import sys
 import os
+import time
 
 current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(current_path)
@@ -7,109 +8,360 @@ sys.path.append(current_path)
 import streamlit as st
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import psycopg2
 import pandas as pd
 
-from utils.utils import *  # Your utility functions
+try:
+    from streamlit.runtime.scriptrunner import RerunException
+except ImportError:  # Moved in later Streamlit versions
+    from streamlit.runtime.scriptrunner_utils.exceptions import RerunException
 
-# Load the YOLO models
-detector = YOLO(current_path + '/Model/LP_Detect_YOLOv11n.pt')  # License Plate Detection model
-recognizer = YOLO(current_path + '/Model/LP_Recog_YOLOv11n.pt')  # License Plate Character Recognition model
+from utils.utils import *  # Your utility functions
+from utils.stream import BLOCK, DROP_OLDEST, FramePipeline, FrameSampler
+from utils.database import (ConnectionPool, VerificationCache, apply_schema, fetch_users_page,
+                            import_registrations, read_registrations_csv, register_plate)
+from utils.backends import TORCH, load_pipeline_models
+from utils.profiling import pipeline_timer
+from utils.motion import MotionGate
+from utils.metrics import metrics_registry, pipeline_collector
+from utils.recognition_cache import RecognitionCache
+from utils.events import AccessEventWriter, PlateEventLogger
+
+# Maximum number of connections kept open to the database by the whole app
+DATABASE_POOL_SIZE = 4
+
+# Inference backend of the models: torch, onnx or openvino, optionally INT8 quantized.
+# Exported models are created next to the .pt weights on first use.
+INFERENCE_BACKEND = os.environ.get('LP_BACKEND', TORCH)
+INFERENCE_INT8 = os.environ.get('LP_INT8', '0') == '1'
+
+# Port of the local Prometheus endpoint (/metrics), metrics are off when unset
+METRICS_PORT = os.environ.get('LP_METRICS_PORT')
+
+# Load the YOLO models once per process, Streamlit reruns reuse them
+@st.cache_resource
+def load_models():
+    # Startup steps are timed like the pipeline stages, see the "Pipeline latency" sidebar
+    with pipeline_timer.stage('load_models'):
+        detector, recognizer = load_pipeline_models(current_path + '/Model', INFERENCE_BACKEND, INFERENCE_INT8,
+                                                    data_folder=current_path + '/Data')
+
+    # Warm-up inference so the first frame does not pay for the model fusing and allocations
+    with pipeline_timer.stage('warmup'):
+        detector(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False, device=device)
+        recognizer(np.zeros((64, 128, 3), dtype=np.uint8), verbose=False, device=device)
+    return detector, recognizer
+
+detector, recognizer = load_models()
+
+# Database connection pool shared by every session, created once per set of credentials
+@st.cache_resource
+def get_connection_pool(database_name, database_host, database_user, database_password, database_port):
+    with pipeline_timer.stage('connect_database'):
+        pool = ConnectionPool(maxconn=DATABASE_POOL_SIZE,
+                              database=database_name,
+                              host=database_host,
+                              user=database_user,
+                              password=database_password,
+                              port=database_port)
+
+        # Databases created by an older version get the missing tables, indexes and triggers
+        with pool.connection() as conn:
+            apply_schema(conn)
+    return pool
 
 # Database connection function
 def connect_to_database(database_name, database_host, database_user, database_password, database_port):
     try:
-        conn = psycopg2.connect(database=database_name,
-                                host=database_host,
-                                user=database_user,
-                                password=database_password,
-                                port=database_port)
+        pool = get_connection_pool(database_name, database_host, database_user, database_password, database_port)
         st.success("Connected to database.")
-        return conn
+        return pool
     except Exception as e:
         st.error(f"Error connecting to database: {e}")
         return None
 
-# Function for taking camera input
-def get_camera_input():
-    cap = cv2.VideoCapture("https://192.168.100.101:8080/video")
-    frame_placeholder = st.empty()
+# IP camera of the gate ("IP Webcam" app, port 8080)
+CAMERA_URL = "https://192.168.100.101:8080/video"
+
+# Buffer sizes and policies of the capture -> inference -> display pipelines.
+# The camera only keeps the newest frame so the preview never lags behind the gate,
+# the video file blocks instead so that no sampled frame is lost.
+CAMERA_BUFFER_SIZE = 1
+CAMERA_BUFFER_POLICY = DROP_OLDEST
+VIDEO_BUFFER_SIZE = 4
+VIDEO_BUFFER_POLICY = BLOCK
+
+# Number of registrations shown per page
+REGISTRATIONS_PAGE_SIZE = 50
+
+# Seconds between two refreshes of the in-memory parking_users index
+VERIFICATION_CACHE_TTL = 30
+
+# Fuzzy verification: a registered plate this close to the recognized one (look-alike characters
+# cost 0.3, any other edit 1) is accepted as is, up to the confirm distance the guard confirms it
+FUZZY_ACCEPT_DISTANCE = 0.3
+FUZZY_CONFIRM_DISTANCE = 1.0
+
+# Frames of the video file are sampled at this inference rate, skipped frames are never decoded
+VIDEO_TARGET_FPS = 5
+
+# The detector only runs when this region of the frame changes (fractions x1, y1, x2, y2 of the
+# frame, None for the whole frame) and at least every MOTION_REFRESH_INTERVAL frames
+MOTION_GATE_ROI = None
+MOTION_REFRESH_INTERVAL = 30
+
+# The detector runs on a copy downscaled to this longest side, the plates are cropped at full resolution
+DETECT_SIZE = 640
+
+# The preview is rendered independently of inference: at most PREVIEW_FPS frames per second,
+# downscaled to PREVIEW_SIZE pixels on the longest side and sent as JPEG
+PREVIEW_FPS = 10
+PREVIEW_SIZE = 640
+PREVIEW_JPEG_QUALITY = 75
+
+# Plates read in the last RECOGNITION_CACHE_TTL seconds are not sent to the recognizer again when
+# their crop matches (perceptual hash within RECOGNITION_CACHE_DISTANCE bits and same thumbnail).
+# Plates differing by one character can share a hash, only raise the distance after measuring it.
+RECOGNITION_CACHE_SIZE = 512
+RECOGNITION_CACHE_TTL = 60
+RECOGNITION_CACHE_DISTANCE = 0
+
+# Function to start the metrics endpoint once per process
+@st.cache_resource
+def start_metrics(port):
+    metrics_registry.serve(int(port))
+    pipeline_timer.add_listener(metrics_registry.observe_stage)
+    print(f"Metrics served on http://127.0.0.1:{port}/metrics")
+    return metrics_registry
+
+# Cache of the recognized plate crops, shared by every pipeline and session of the process
+@st.cache_resource
+def get_recognition_cache():
+    return RecognitionCache(RECOGNITION_CACHE_SIZE, RECOGNITION_CACHE_TTL, RECOGNITION_CACHE_DISTANCE)
+
+# Function to start a pipeline once and keep it across Streamlit reruns
+def get_pipeline(key, source, buffer_size, buffer_policy, sampler=None, on_plates=None):
+    if key not in st.session_state:
+        # Each source follows its own plates, the recognizer only runs on new or uncertain tracks
+        tracker = PlateTracker()
+        # An empty lane is not sent to the detector
+        gate = MotionGate(roi=MOTION_GATE_ROI, refresh_interval=MOTION_REFRESH_INTERVAL)
+        st.session_state[key + '_gate'] = gate
+        recognition_cache = get_recognition_cache()
+
+        def recognize_frame(frame):
+            result = process_frame(frame, detector, recognizer, tracker=tracker, gate=gate,
+                                   detect_size=DETECT_SIZE, annotate=False, recognition_cache=recognition_cache)
+            if on_plates is not None:
+                on_plates(result[2])
+            return result
+
+        pipeline = FramePipeline(source, recognize_frame,
+                                 capture_size=buffer_size, capture_policy=buffer_policy,
+                                 result_size=buffer_size, result_policy=buffer_policy,
+                                 sampler=sampler)
+        try:
+            st.session_state[key] = pipeline.start()
+            metrics_registry.add_collector(pipeline_collector(key.replace('_pipeline', ''), pipeline))
+        except IOError as e:
+            st.error(f"Error opening video source: {e}")
+            return None
+    return st.session_state[key]
+
+# Function to stop a pipeline and forget it
+def release_pipeline(key):
+    pipeline = st.session_state.pop(key, None)
+    if pipeline is not None:
+        pipeline.stop()
+
+# Function to draw the plates on a downscaled copy of the frame
+def render_preview(frame, plates):
+    preview, scale = resize_to_fit(frame, PREVIEW_SIZE)
+    if preview is frame:
+        preview = frame.copy()
+    draw_plates(preview, plates, scale)
+    cv2.putText(preview, f"FPS: {pipeline_timer.fps('frame'):.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    return preview
+
+# Function to send a preview to the browser as a JPEG instead of a raw frame
+def show_preview(placeholder, preview):
+    ok, jpeg = cv2.imencode('.jpg', preview, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+    if ok:
+        placeholder.image(jpeg.tobytes(), use_column_width=True)
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            st.error("Error reading from camera.")
-            break
-
-        frame, plate = process_frame(frame, detector, recognizer)
-        frame_placeholder.image(frame, channels="BGR", use_column_width=True)
-        st.session_state['frame'] = frame
+# Function for taking camera input
+def get_camera_input(on_plates=None):
+    pipeline = get_pipeline('camera_pipeline', CAMERA_URL,
+                            CAMERA_BUFFER_SIZE, CAMERA_BUFFER_POLICY, on_plates=on_plates)
+    if pipeline is None:
+        return None
 
-        if st.session_state['take_snapshot']:
-            cap.release()
-            st.session_state['take_snapshot'] = False
-            return plate
+    frame_placeholder = st.empty()
+    next_preview = 0.0
+    keep_pipeline = False
 
-    cap.release()
+    try:
+        while pipeline.running:
+            item = pipeline.read(timeout=1)
+            if item is None:
+                continue
+
+            # Results keep coming at the inference rate, the preview is only refreshed at PREVIEW_FPS
+            _, (frame, plate, plates) = item
+            snapshot = st.session_state['take_snapshot']
+            if snapshot or time.monotonic() >= next_preview:
+                with pipeline_timer.stage('preview'):
+                    preview = render_preview(frame, plates)
+                    show_preview(frame_placeholder, preview)
+                st.session_state['frame'] = preview
+                next_preview = time.monotonic() + 1 / PREVIEW_FPS
+
+            if snapshot:
+                st.session_state['take_snapshot'] = False
+                return plate
+
+        st.error("Error reading from camera.")
+    except RerunException:
+        # A widget changed, the next run goes on reading the same pipeline
+        keep_pipeline = True
+        raise
+    finally:
+        # The camera is not left open when the stream stops, fails or the session ends
+        if not keep_pipeline:
+            release_pipeline('camera_pipeline')
 
 # Function for taking video input
-def get_video_input(video_source):
-    skip_frames = 5
+def get_video_input(video_source, on_plates=None):
+    sampler = FrameSampler(skip_frames=4, target_fps=VIDEO_TARGET_FPS)
 
-    if 'cap' not in st.session_state:
-        st.session_state.cap = cv2.VideoCapture(video_source)
+    pipeline = get_pipeline('video_pipeline', video_source,
+                            VIDEO_BUFFER_SIZE, VIDEO_BUFFER_POLICY, sampler=sampler, on_plates=on_plates)
+    if pipeline is None:
+        return None, None
 
-    cap = st.session_state.cap
     frame_placeholder = st.empty()
+    next_preview = 0.0
+    keep_pipeline = False
 
-    while cap.isOpened():
-        for _ in range(skip_frames):
-            ret, frame = cap.read()
-            if not ret:
-                st.warning("No frames available.")
-                break
-
-        processed_frame, plate = process_frame(frame, detector, recognizer)
-        frame_placeholder.image(processed_frame, channels="BGR", use_column_width=True)
-        st.session_state['frame'] = frame
-
-        if st.session_state['take_snapshot']:
-            st.session_state['take_snapshot'] = False
-            return frame, plate
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cap.release()
-    st.success("Video ended.")
-
-# Function for verifying license plate in database
-def verify_license_plate(plate, conn):
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT user_name, msv FROM parking_users WHERE plate = %s", (plate,))
-        result = cur.fetchone()
-        return result
+        while pipeline.running:
+            item = pipeline.read(timeout=1)
+            if item is None:
+                continue
+
+            # Results keep coming at the inference rate, the preview is only refreshed at PREVIEW_FPS
+            _, (frame, plate, plates) = item
+            snapshot = st.session_state['take_snapshot']
+            if snapshot or time.monotonic() >= next_preview:
+                with pipeline_timer.stage('preview'):
+                    preview = render_preview(frame, plates)
+                    show_preview(frame_placeholder, preview)
+                st.session_state['frame'] = preview
+                next_preview = time.monotonic() + 1 / PREVIEW_FPS
+
+            if snapshot:
+                # The video goes on from this frame after "Continue"
+                keep_pipeline = True
+                st.session_state['take_snapshot'] = False
+                return preview, plate
+
+        st.success("Video ended.")
+        return None, None
+    except RerunException:
+        # A widget changed, the next run goes on reading the same pipeline
+        keep_pipeline = True
+        raise
+    finally:
+        if not keep_pipeline:
+            release_pipeline('video_pipeline')
+
+# Function to get the in-memory index of parking_users, shared by every session and refreshed in the background
+@st.cache_resource
+def get_verification_cache(database_name, database_host, database_user, database_password, database_port):
+    pool = get_connection_pool(database_name, database_host, database_user, database_password, database_port)
+    cache = VerificationCache(pool.getconn, pool.putconn, ttl=VERIFICATION_CACHE_TTL)
+    try:
+        # Registrations made by other gate stations are pushed by the parking_users trigger,
+        # the listening connection stays open so it is not taken from the pool
+        cache.listen(psycopg2.connect(database=database_name,
+                                      host=database_host,
+                                      user=database_user,
+                                      password=database_password,
+                                      port=database_port))
     except Exception as e:
-        st.error(f"Error during verification: {e}")
-        return None
+        print(f"Change notifications unavailable, refreshing every {VERIFICATION_CACHE_TTL}s: {e}")
+    return cache.start()
+
+# Background writer of the access_events table, shared by every session
+@st.cache_resource
+def get_event_writer(database_name, database_host, database_user, database_password, database_port):
+    pool = get_connection_pool(database_name, database_host, database_user, database_password, database_port)
+    writer = AccessEventWriter(pool.getconn, pool.putconn).start()
+    metrics_registry.add_collector(lambda: [('lp_queue_depth', {'source': 'access_events', 'buffer': 'pending'}, writer.pending)])
+    return writer
+
+# Function to log every plate recognized on a source, verified against the in-memory index
+def make_event_logger(writer, camera_id, cache):
+    return PlateEventLogger(writer, camera_id, lambda plate: bool(cache.match(plate, FUZZY_ACCEPT_DISTANCE)))
+
+# Function for verifying license plate in database, returns (owner, registered plate, distance)
+def verify_license_plate(plate, cache):
+    with pipeline_timer.stage('verify'):
+        matches = cache.match(plate, FUZZY_CONFIRM_DISTANCE)
+        if not matches or matches[0][1] > 0:
+            # The plate may have been registered since the last refresh
+            cache.refresh()
+            matches = cache.match(plate, FUZZY_CONFIRM_DISTANCE)
+
+    if cache.last_error is not None:
+        st.warning(f"Database unreachable, verifying against the cached registrations: {cache.last_error}")
+    if not matches:
+        return None, None, None
+    registered_plate, distance, owner = matches[0]
+    return owner, registered_plate, distance
 
 # Function to add license plate to database
-def add_to_database(plate, owner, msv, conn):
+def add_to_database(plate, owner, msv, pool, cache=None):
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT COALESCE(MAX(id_user), 0) + 1 FROM parking_users")
-        new_id = cur.fetchone()[0]
-        cur.execute("INSERT INTO parking_users (id_user, plate, user_name, msv) VALUES (%s, %s, %s, %s)",
-                    (new_id, plate, owner, msv))
-        conn.commit()
+        with metrics_registry.time('lp_db_query_seconds', errors='lp_db_errors_total', operation='register'), \
+                pool.connection() as conn:
+            register_plate(conn, plate, owner, msv)
+        if cache is not None:
+            cache.add(plate, owner, msv)
         st.success("License plate added to database.")
     except Exception as e:
         st.error(f"Error adding to database: {e}")
 
+# Function to import registrations from a CSV file (plate, user_name, msv columns)
+def import_csv_to_database(file, pool, cache=None):
+    try:
+        rows = read_registrations_csv(file)
+        with metrics_registry.time('lp_db_query_seconds', errors='lp_db_errors_total', operation='import'), \
+                pool.connection() as conn:
+            import_registrations(conn, rows)
+        if cache is not None:
+            cache.refresh()
+        st.success(f"Imported {len(rows)} registrations.")
+    except Exception as e:
+        st.error(f"Error importing registrations: {e}")
+
+# Function to show one page of the registered plates in a placeholder
+def show_registrations(placeholder, pool, page):
+    with metrics_registry.time('lp_db_query_seconds', errors='lp_db_errors_total', operation='fetch_page'), \
+            pool.connection() as conn:
+        rows, columns, has_next = fetch_users_page(conn, page, REGISTRATIONS_PAGE_SIZE)
+    with placeholder.container():
+        st.write(pd.DataFrame(rows, columns=columns))
+        if has_next:
+            st.caption("More registrations on the next page.")
+
 # Main function
 def main():
+    rerun_start = time.perf_counter()
+
+    if METRICS_PORT:
+        start_metrics(METRICS_PORT)
+
     # Initialize session state variables
     if 'plate' not in st.session_state:
         st.session_state['plate'] = ''
@@ -125,6 +377,23 @@ def main():
     video_path = current_path + "/App/test_vid.MOV"
     st.title("License Plate Detection and Verification")
 
+    # Latency of every pipeline stage over the recent frames
+    with st.sidebar.expander("Pipeline latency"):
+        summary = pipeline_timer.summary()
+        if summary:
+            st.dataframe(pd.DataFrame(summary).T.round(2))
+            st.write(f"Processing rate: {pipeline_timer.fps('frame'):.1f} frames/sec")
+        for key in ('camera_pipeline', 'video_pipeline'):
+            gate = st.session_state.get(key + '_gate')
+            if gate is not None and gate.frames:
+                st.write(f"{key.split('_')[0].capitalize()}: detection skipped on {gate.skipped}/{gate.frames} "
+                         f"static frames ({gate.skip_ratio:.0%})")
+        recognition_cache = get_recognition_cache()
+        if recognition_cache.hits + recognition_cache.misses:
+            st.write(f"Recognition cache: {recognition_cache.hit_rate:.0%} hits "
+                     f"({recognition_cache.hits}/{recognition_cache.hits + recognition_cache.misses}), "
+                     f"{len(recognition_cache)} plates")
+
     # Database connection
     with st.spinner("Loading data from database..."):
         database_name = st.text_input("Enter database name:")
@@ -132,14 +401,40 @@ def main():
         database_user = st.text_input("Enter database user:")
         database_password = st.text_input("Enter database password:")
         database_port = st.text_input("Enter database port:")
-        conn = connect_to_database(database_name, database_host, database_user, database_password, database_port)
+        pool = connect_to_database(database_name, database_host, database_user, database_password, database_port)
 
     # Ensure the connection is valid
-    if conn is None:
+    if pool is None:
+        pipeline_timer.record('rerun', time.perf_counter() - rerun_start)
         return  # Exit the app if no database connection
 
+    cache = get_verification_cache(database_name, database_host, database_user, database_password, database_port)
+    event_writer = get_event_writer(database_name, database_host, database_user, database_password, database_port)
+
+    # Bulk registration from a CSV file
+    with st.sidebar.expander("Import registrations"):
+        csv_file = st.file_uploader("CSV with plate, user_name, msv columns", type='csv')
+        if csv_file is not None and st.button("Import"):
+            import_csv_to_database(csv_file, pool, cache)
+
+    # Registered plates, one page at a time, shown on every run so that the page can be changed
+    with st.sidebar.expander("Registrations"):
+        page = st.number_input("Page", min_value=1, value=1, key='registrations_page') - 1
+        registrations = st.empty()
+    show_registrations(registrations, pool, page)
+
     # Video source selection
     selection = st.radio("Select video source:", ("Camera", "Video File"))
+
+    # Only the selected source keeps a pipeline, the other one is stopped when the selection changes
+    active_pipeline = 'camera_pipeline' if selection == "Camera" else 'video_pipeline'
+    previous_pipeline = st.session_state.get('active_pipeline')
+    if previous_pipeline is not None and previous_pipeline != active_pipeline:
+        release_pipeline(previous_pipeline)
+    st.session_state['active_pipeline'] = active_pipeline
+
+    # Time Streamlit takes to handle an interaction, recorded before the stream blocks the rest of the run
+    pipeline_timer.record('rerun', time.perf_counter() - rerun_start)
     
     # Handle video input
     if selection == "Camera":
@@ -155,7 +450,7 @@ def main():
 
         with col1:
             if st.session_state['plate'] == '':
-                plate = get_camera_input()
+                plate = get_camera_input(make_event_logger(event_writer, CAMERA_URL, cache))
                 if plate:
                     st.session_state['plate'] = plate  # Store detected plate in session state
             else:
@@ -175,12 +470,12 @@ def main():
 
         with col1:
             if st.session_state['plate'] == '':
-                frame, plate = get_video_input(video_path)
+                frame, plate = get_video_input(video_path, make_event_logger(event_writer, video_path, cache))
                 if plate:
                     st.session_state['plate'] = plate  # Store detected plate in session state
             else:
                 st.image(st.session_state['frame'], channels="BGR", use_column_width=True)
-                
+
 
     # License plate handling and form display
     with col2:
@@ -188,9 +483,19 @@ def main():
             plate = st.session_state['plate']
             st.write("Detected license Plate: ", plate)
 
-            owner = verify_license_plate(plate, conn)
-            if owner:
+            owner, registered_plate, distance = verify_license_plate(plate, cache)
+            if owner and distance <= FUZZY_ACCEPT_DISTANCE:
+                if distance > 0:
+                    st.info(f"Matched registered plate {registered_plate} (distance {distance:.1f})")
                 st.success(f"Verified! Plate owner: {owner[0]}, MSV: {owner[1]}")
+            elif owner and st.session_state.get('confirmed_plate') == (plate, registered_plate):
+                st.success(f"Verified by the guard! Plate owner: {owner[0]}, MSV: {owner[1]}")
+            elif owner:
+                st.warning(f"Closest registered plate: {registered_plate} (distance {distance:.1f}), "
+                           f"owner: {owner[0]}, MSV: {owner[1]}")
+                if st.button(f"Confirm {registered_plate}"):
+                    st.session_state['confirmed_plate'] = (plate, registered_plate)
+                    st.rerun()
             else:
                 st.error("Not verified. Add to database:")
 
@@ -205,18 +510,14 @@ def main():
         plate = st.session_state['plate']
         name = st.session_state['name']
         msv = st.session_state['msv']
-        add_to_database(plate, name, msv, conn)
+        add_to_database(plate, name, msv, pool, cache)
 
         st.success("License plate added to database. Ready for new plate detection.")
         st.session_state['plate'] = ''  # Reset plate to allow new detection
         st.session_state['form_submitted'] = False  # Reset form submission flag
         
-        # print the database
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM parking_users")
-        rows = cur.fetchall()
-        df = pd.DataFrame(rows, columns=[desc[0] for desc in cur.description])
-        st.write(df)
+        # Show the new registration in the table
+        show_registrations(registrations, pool, page)
 
 if __name__ == "__main__":
     main()
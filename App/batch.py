@@ -0,0 +1,248 @@
+import sys
+import os
+
+current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(current_path)
+
+import argparse
+import csv
+import json
+import multiprocessing
+import queue
+import time
+from datetime import datetime, timezone
+
+import cv2
+
+from utils.utils import recognize_plates
+from utils.backends import init_model_worker, worker_models
+from utils.stream import FrameSampler
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+VIDEO_EXTENSIONS = ('.mov', '.mp4', '.avi', '.mkv')
+
+CSV_FIELDS = ['source', 'frame', 'timestamp', 'plate', 'confidence', 'x1', 'y1', 'x2', 'y2']
+
+# Function to list the images and videos of the inputs
+def collect_inputs(inputs):
+    images, videos = [], []
+    for path in inputs:
+        paths = [path]
+        if os.path.isdir(path):
+            paths = sorted(entry.path for entry in os.scandir(path) if entry.is_file())
+        for file_path in paths:
+            extension = os.path.splitext(file_path)[1].lower()
+            if extension in IMAGE_EXTENSIONS:
+                images.append(os.path.abspath(file_path))
+            elif extension in VIDEO_EXTENSIONS:
+                videos.append(os.path.abspath(file_path))
+    return images, videos
+
+# Function to read which frames are already in the output file
+def read_done_frames(output_path):
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, 'r', newline='') as file:
+        if output_path.endswith('.csv'):
+            rows = csv.DictReader(file)
+        else:
+            rows = []
+            for line in file:
+                try:
+                    rows.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Last line of an interrupted run
+
+        for row in rows:
+            try:
+                done.setdefault(row['source'], set()).add(int(row['frame']))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return done
+
+# Function to split the work into shards for the worker pool
+def make_shards(images, videos, done, image_chunk, segment_frames, stride):
+    shards = []
+
+    pending = [path for path in images if 0 not in done.get(path, ())]
+    for i in range(0, len(pending), image_chunk):
+        shards.append(('images', pending[i:i + image_chunk]))
+
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        done_frames = done.get(path, set())
+        if frame_count <= 0:
+            # Unknown length, the whole video is a single shard
+            segments = [(0, sys.maxsize)]
+        else:
+            segments = [(start, min(start + segment_frames, frame_count))
+                        for start in range(0, frame_count, segment_frames)]
+
+        for start, end in segments:
+            # Resume after the last frame written for this segment
+            written = [frame for frame in done_frames if start <= frame < end]
+            if written:
+                start = max(written) + stride
+            if start < end:
+                shards.append(('video', (path, start, end)))
+    return shards
+
+def frame_record(source, frame_index, timestamp, plates):
+    return {
+        'source': source,
+        'frame': frame_index,
+        'timestamp': timestamp,
+        'plates': [
+            {'text': plate['text'], 'confidence': round(plate['confidence'], 4), 'box': list(plate['box'])}
+            for plate in plates
+        ],
+    }
+
+def process_images(paths):
+    detector, recognizer = worker_models()
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        timestamp = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc).isoformat()
+        yield frame_record(path, 0, timestamp, recognize_plates(frame, detector, recognizer))
+
+def process_video(path, start, end, stride):
+    detector, recognizer = worker_models()
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    sampler = FrameSampler(skip_frames=0)
+
+    try:
+        frame_index = start
+        while frame_index < end:
+            ret, frame = sampler.read(cap)
+            if not ret:
+                break
+
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            yield frame_record(path, frame_index, timestamp, recognize_plates(frame, detector, recognizer))
+
+            # Skipped frames are only grabbed, never decoded
+            sampler.skip_frames = stride - 1
+            frame_index += stride
+    finally:
+        cap.release()
+
+# Queue the workers send their records to, set by init_worker
+result_queue = None
+
+def init_worker(results, *model_args):
+    global result_queue
+    result_queue = results
+    init_model_worker(*model_args)
+
+# Function to process a shard, every record is sent to the writer as soon as its frame is done
+def run_shard(args):
+    (kind, payload), stride = args
+    start_time = time.perf_counter()
+    records = process_images(payload) if kind == 'images' else process_video(*payload, stride)
+
+    count = 0
+    for record in records:
+        result_queue.put(('record', record))
+        count += 1
+    # Sent after the records of the shard, so the writer has them all when it gets it
+    result_queue.put(('done', os.getpid(), count, time.perf_counter() - start_time))
+
+class ResultWriter:
+    def __init__(self, output_path):
+        self.csv = output_path.endswith('.csv')
+        new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self.file = open(output_path, 'a', newline='')
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, record):
+        if not self.csv:
+            self.file.write(json.dumps(record) + '\n')
+            return
+
+        # One row per plate, frames without plates still get a row so they are not redone
+        plates = record['plates'] or [{'text': '', 'confidence': '', 'box': ['', '', '', '']}]
+        for plate in plates:
+            x1, y1, x2, y2 = plate['box']
+            self.writer.writerow({'source': record['source'], 'frame': record['frame'],
+                                  'timestamp': record['timestamp'], 'plate': plate['text'],
+                                  'confidence': plate['confidence'], 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2})
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run license plate detection and recognition over image folders and video files.")
+    parser.add_argument('inputs', nargs='+', help="Images, videos or folders containing them")
+    parser.add_argument('--output', default='plates.jsonl', help="Output file, .jsonl or .csv")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--stride', type=int, default=5, help="Process every n-th video frame")
+    parser.add_argument('--segment-frames', type=int, default=3000, help="Video frames per shard")
+    parser.add_argument('--image-chunk', type=int, default=64, help="Images per shard")
+    parser.add_argument('--detector', default=current_path + '/Model/LP_Detect_YOLOv11n.pt')
+    parser.add_argument('--recognizer', default=current_path + '/Model/LP_Recog_YOLOv11n.pt')
+    args = parser.parse_args()
+
+    images, videos = collect_inputs(args.inputs)
+    done = read_done_frames(args.output)
+    shards = make_shards(images, videos, done, args.image_chunk, args.segment_frames, args.stride)
+    print(f"{len(images)} images, {len(videos)} videos, {len(shards)} shards left to process")
+    if not shards:
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    context = multiprocessing.get_context('spawn')  # Forking a process holding torch threads is unsafe
+    writer = ResultWriter(args.output)
+    stats = {}
+
+    # Bounded, so that workers wait for the writer instead of piling records up in memory
+    results = context.Queue(maxsize=args.workers * 64)
+
+    start_time = time.perf_counter()
+    with context.Pool(args.workers, initializer=init_worker,
+                      initargs=(results, args.detector, args.recognizer, threads)) as pool:
+        tasks = pool.map_async(run_shard, [(shard, args.stride) for shard in shards], chunksize=1)
+        finished = 0
+        while finished < len(shards):
+            try:
+                message = results.get(timeout=1.0)
+            except queue.Empty:
+                if tasks.ready() and not tasks.successful():
+                    tasks.get()  # Raises the error of the worker
+                continue
+
+            # Every record is written and flushed as it comes, an interrupted run resumes after it
+            if message[0] == 'record':
+                writer.write(message[1])
+                writer.flush()
+                continue
+
+            _, pid, frames, seconds = message
+            finished += 1
+            worker_frames, busy = stats.get(pid, (0, 0.0))
+            stats[pid] = (worker_frames + frames, busy + seconds)
+            print(f"[{finished}/{len(shards)}] worker {pid}: {frames} frames in {seconds:.1f}s "
+                  f"({frames / max(seconds, 1e-6):.2f} frames/sec)")
+    writer.close()
+
+    elapsed = time.perf_counter() - start_time
+    total_frames = sum(frames for frames, _ in stats.values())
+    for pid, (frames, busy) in sorted(stats.items()):
+        print(f"Worker {pid}: {frames} frames, {frames / max(busy, 1e-6):.2f} frames/sec")
+    print(f"Total: {total_frames} frames in {elapsed:.1f}s, {total_frames / max(elapsed, 1e-6):.2f} frames/sec")
+
+if __name__ == "__main__":
+    main()
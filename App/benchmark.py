@@ -0,0 +1,164 @@
+import sys
+import os
+
+current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(current_path)
+
+import argparse
+import json
+import platform
+import time
+
+import cv2
+
+from utils.utils import process_frame, PlateTracker
+from utils.motion import MotionGate
+from utils.recognition_cache import RecognitionCache
+from utils.backends import BACKENDS, TORCH, load_pipeline_models, sample_images
+from utils.profiling import StageTimer, compare_summaries
+
+# Function to load the fixture frames of the benchmark
+def load_fixtures(image_folder, image_count, video_path, video_frames, video_stride):
+    frames = []
+
+    if image_folder:
+        for path in sample_images(image_folder, image_count):
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+
+    if video_path:
+        cap = cv2.VideoCapture(video_path)
+        index = 0
+        while len(frames) < image_count + video_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % video_stride == 0:
+                frames.append(frame)
+            index += 1
+        cap.release()
+
+    return frames
+
+# Function to run the pipeline over the fixtures and collect the stage timings
+def run_benchmark(frames, detector, recognizer, repeat=3, warmup=5, track=False, gate=False, gate_roi=None,
+                  detect_size=None, cache=False):
+    for frame in frames[:warmup]:
+        process_frame(frame.copy(), detector, recognizer, timer=StageTimer())
+
+    timer = StageTimer(window=len(frames) * repeat)
+    gated, skipped, hits, misses = 0, 0, 0, 0
+    start_time, start_cpu = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        # The fixtures are replayed as one stream, the tracker and the gate start empty at every pass
+        tracker = PlateTracker() if track else None
+        motion_gate = MotionGate(roi=gate_roi) if gate else None
+        recognition_cache = RecognitionCache() if cache else None
+        for frame in frames:
+            process_frame(frame.copy(), detector, recognizer, tracker=tracker, timer=timer, gate=motion_gate,
+                          detect_size=detect_size, recognition_cache=recognition_cache)
+        if motion_gate is not None:
+            gated += motion_gate.frames
+            skipped += motion_gate.skipped
+        if recognition_cache is not None:
+            hits += recognition_cache.hits
+            misses += recognition_cache.misses
+    elapsed = time.perf_counter() - start_time
+    cpu_seconds = time.process_time() - start_cpu
+
+    report = {
+        'frames': len(frames) * repeat,
+        'fps': len(frames) * repeat / elapsed,
+        'cpu_seconds': cpu_seconds,
+        'stages': timer.summary(),
+    }
+    if gate:
+        report['gate'] = {'frames': gated, 'skipped': skipped}
+    if cache:
+        report['recognition_cache'] = {'hits': hits, 'misses': misses}
+    return report
+
+def print_report(report):
+    print(f"{'stage':<12}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in report['stages'].items():
+        print(f"{name:<12}{stats['count']:>8}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    print(f"{report['frames']} frames, {report['fps']:.2f} frames/sec, {report['cpu_seconds']:.1f}s of CPU time")
+    if 'gate' in report:
+        gate = report['gate']
+        print(f"motion gate skipped detection on {gate['skipped']}/{gate['frames']} frames")
+    if 'recognition_cache' in report:
+        cache = report['recognition_cache']
+        lookups = cache['hits'] + cache['misses']
+        print(f"recognition cache: {cache['hits']}/{lookups} hits ({cache['hits'] / max(lookups, 1):.1%})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the license plate pipeline on fixed fixtures.")
+    parser.add_argument('--images', default=current_path + '/Data/Detection/images/val', help="Folder of fixture images")
+    parser.add_argument('--image-count', type=int, default=100)
+    parser.add_argument('--video', default=current_path + '/App/test_vid.MOV', help="Fixture video")
+    parser.add_argument('--video-frames', type=int, default=100)
+    parser.add_argument('--video-stride', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--track', action='store_true', help="Run with the plate tracker")
+    parser.add_argument('--gate', action='store_true', help="Skip detection on static frames with the motion gate")
+    parser.add_argument('--gate-roi', type=float, nargs=4, default=None, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                        help="Region of interest of the motion gate, fractions of the frame")
+    parser.add_argument('--recognition-cache', action='store_true', help="Reuse the text of plate crops already read")
+    parser.add_argument('--detect-size', type=int, default=None, help="Longest side the frames are downscaled to for detection")
+    parser.add_argument('--backend', default=TORCH, choices=BACKENDS)
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--output', default=None, help="Write the report to this JSON file")
+    parser.add_argument('--compare', default=None, help="Baseline JSON report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="Relative p50/p95 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    image_folder = args.images if os.path.isdir(args.images) else None
+    video_path = args.video if os.path.exists(args.video) else None
+    frames = load_fixtures(image_folder, args.image_count, video_path, args.video_frames, args.video_stride)
+    if not frames:
+        sys.exit("No fixture frames found, check --images and --video")
+
+    detector, recognizer = load_pipeline_models(current_path + '/Model', args.backend, args.int8,
+                                                data_folder=current_path + '/Data')
+    report = run_benchmark(frames, detector, recognizer, args.repeat, track=args.track, gate=args.gate,
+                           gate_roi=args.gate_roi, detect_size=args.detect_size,
+                           cache=args.recognition_cache)
+    report['config'] = {
+        'backend': args.backend + (' int8' if args.int8 else ''),
+        'track': args.track,
+        'gate': args.gate,
+        'detect_size': args.detect_size,
+        'recognition_cache': args.recognition_cache,
+        'fixtures': {'images': image_folder, 'video': video_path, 'frames': len(frames)},
+        'machine': platform.platform(),
+        'processor': platform.processor(),
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+
+        regressed = False
+        print(f"\nCompared to {args.compare}:")
+        for metric in ('p50_ms', 'p95_ms'):
+            for name, before, after, change, slower in compare_summaries(baseline['stages'], report['stages'],
+                                                                         args.threshold, metric):
+                flag = '  REGRESSION' if slower else ''
+                print(f"{name:<12}{metric:>8}{before:>10.2f} -> {after:>8.2f} ({change:+.1%}){flag}")
+                regressed = regressed or slower
+        print(f"frames/sec {baseline['fps']:.2f} -> {report['fps']:.2f}")
+        if 'cpu_seconds' in baseline:
+            print(f"CPU time {baseline['cpu_seconds']:.1f}s -> {report['cpu_seconds']:.1f}s")
+
+        if regressed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
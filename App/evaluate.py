@@ -0,0 +1,306 @@
+import sys
+import os
+
+current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(current_path)
+
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import time
+
+import cv2
+import numpy as np
+
+from utils.utils import crop_plates, decode_plate_arrays, index_folder, read_plate_characters
+from utils.database import normalize_plate
+from utils.backends import init_model_worker, worker_models
+from utils.fuzzy import edit_distance
+
+FULL = 'full'    # Full frames: detector -> recognizer -> ordering -> decoding
+CROPS = 'crops'  # Plate crops: recognizer -> ordering -> decoding
+
+# Arrays of a cached prediction, the plates of an image are flattened with their character counts
+PREDICTION_KEYS = ('plate_boxes', 'plate_conf', 'char_counts', 'char_boxes', 'char_classes', 'char_conf')
+
+# Function to hash a file, used for the cache keys of the images and the models
+def file_checksum(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to list the (name, image path, text label path) of an evaluation set
+def collect_samples(image_folder, text_label_folder):
+    images = index_folder(image_folder, ('.jpg', '.jpeg', '.png'))
+    labels = index_folder(text_label_folder, ('.txt',))
+    return [(name, images[name][0], labels[name][0]) for name in sorted(images) if name in labels]
+
+def empty_prediction():
+    return {
+        'plate_boxes': np.zeros((0, 4), dtype=np.float32),
+        'plate_conf': np.zeros(0, dtype=np.float32),
+        'char_counts': np.zeros(0, dtype=np.int64),
+        'char_boxes': np.zeros((0, 4), dtype=np.float32),
+        'char_classes': np.zeros(0, dtype=np.int64),
+        'char_conf': np.zeros(0, dtype=np.float32),
+    }
+
+# Function to run the models on a shard of images and keep their raw outputs
+def predict_shard(args):
+    mode, paths, detect_batch = args
+    detector, recognizer = worker_models()
+    start_time = time.perf_counter()
+
+    frames, kept = [], []
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is not None:
+            frames.append(frame)
+            kept.append(path)
+
+    # The plates of every image, the crops of all images are recognized in one call
+    plate_boxes, plate_conf, crops = [], [], []
+    if mode == FULL:
+        for i in range(0, len(frames), detect_batch):
+            results = detector(frames[i:i + detect_batch], verbose=False, conf=0.4)
+            for frame, result in zip(frames[i:i + detect_batch], results):
+                boxes = result.boxes.xyxy.cpu().numpy()
+                plate_boxes.append(boxes)
+                plate_conf.append(result.boxes.conf.cpu().numpy())
+                crops.append(crop_plates(frame, boxes)[0])
+    else:
+        for frame in frames:
+            height, width = frame.shape[:2]
+            plate_boxes.append(np.array([[0, 0, width, height]], dtype=np.float32))
+            plate_conf.append(np.ones(1, dtype=np.float32))
+            crops.append([frame])
+
+    flat = [(i, j) for i, image_crops in enumerate(crops) for j, crop in enumerate(image_crops) if crop.size > 0]
+    recog_results = recognizer([crops[i][j] for i, j in flat], verbose=False) if flat else []
+    outputs = {(i, j): result for (i, j), result in zip(flat, recog_results)}
+
+    predictions = []
+    for i, path in enumerate(kept):
+        prediction = empty_prediction()
+        counts, char_boxes, char_classes, char_conf = [], [], [], []
+        for j in range(len(plate_boxes[i])):
+            result = outputs.get((i, j))
+            if result is None:
+                counts.append(0)
+                continue
+            boxes = result.boxes.xyxy.cpu().numpy()
+            counts.append(len(boxes))
+            char_boxes.append(boxes)
+            char_classes.append(result.boxes.cls.cpu().numpy().astype(np.int64))
+            char_conf.append(result.boxes.conf.cpu().numpy())
+
+        prediction['plate_boxes'] = np.asarray(plate_boxes[i], dtype=np.float32).reshape(-1, 4)
+        prediction['plate_conf'] = np.asarray(plate_conf[i], dtype=np.float32)
+        prediction['char_counts'] = np.array(counts, dtype=np.int64)
+        if char_boxes:
+            prediction['char_boxes'] = np.concatenate(char_boxes).astype(np.float32)
+            prediction['char_classes'] = np.concatenate(char_classes)
+            prediction['char_conf'] = np.concatenate(char_conf).astype(np.float32)
+        predictions.append((path, prediction))
+
+    return os.getpid(), predictions, time.perf_counter() - start_time
+
+class PredictionCache:
+    """
+    Raw model outputs of every image, stored as one .npz per (image checksum, model checksum).
+
+    Ordering and decoding are recomputed from the cached character boxes at every run, so only
+    a change of image or model weights triggers new inference.
+
+    Args:
+        folder (str): Cache folder
+        model_key (str): Checksum of the models (and mode) the predictions were made with
+    """
+
+    def __init__(self, folder, model_key):
+        self.folder = os.path.join(folder, model_key)
+        os.makedirs(self.folder, exist_ok=True)
+
+    def path(self, image_key):
+        return os.path.join(self.folder, image_key + '.npz')
+
+    def load(self, image_key):
+        path = self.path(image_key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return {key: data[key] for key in PREDICTION_KEYS}
+        except (OSError, ValueError, KeyError):
+            return None  # Interrupted write
+
+    def save(self, image_key, prediction):
+        # Written next to the target then renamed, an interrupted run never leaves a partial file
+        temporary = self.path(image_key) + '.tmp.npz'
+        np.savez(temporary, **prediction)
+        os.replace(temporary, self.path(image_key))
+
+# Function to turn the raw predictions into plate texts, the cheap stages of the chain
+def decode_predictions(predictions):
+    """
+    Orders and decodes the characters of every plate, and keeps the most confident plate of each image.
+
+    Returns:
+        texts (list): Predicted text of every image, '' when no plate was found
+    """
+    recog_boxes, recog_classes, recog_conf, owners = [], [], [], []
+    for index, prediction in enumerate(predictions):
+        offsets = np.concatenate([[0], np.cumsum(prediction['char_counts'])])
+        for j in range(len(prediction['char_counts'])):
+            start, end = offsets[j], offsets[j + 1]
+            recog_boxes.append(prediction['char_boxes'][start:end])
+            recog_classes.append(prediction['char_classes'][start:end])
+            recog_conf.append(prediction['char_conf'][start:end])
+            owners.append((index, prediction['plate_conf'][j]))
+
+    texts = [''] * len(predictions)
+    best = [-1.0] * len(predictions)
+    for (index, plate_conf), (text, _) in zip(owners, decode_plate_arrays(recog_boxes, recog_classes, recog_conf)):
+        if text and plate_conf > best[index]:
+            texts[index], best[index] = text, plate_conf
+    return texts
+
+# Function to compare the predicted texts with the ground truth
+def score(names, truths, texts):
+    exact, errors, characters, mismatches = 0, 0, 0, []
+    for name, truth, text in zip(names, truths, texts):
+        distance = edit_distance(text, truth)
+        exact += distance == 0
+        errors += distance
+        characters += len(truth)
+        if distance:
+            mismatches.append((name, truth, text, distance))
+
+    return {
+        'images': len(names),
+        'exact_match': exact / len(names) if names else 0.0,
+        'cer': errors / characters if characters else 0.0,
+        'no_plate': sum(1 for text in texts if not text),
+    }, mismatches
+
+def evaluate_set(mode, image_folder, label_folder, args, model_checksums, pool):
+    samples = collect_samples(image_folder, label_folder)
+    if not samples:
+        print(f"{mode} {image_folder}: no image with a text label in {label_folder}")
+        return None, []
+
+    models = model_checksums[1] if mode == CROPS else model_checksums[0] + model_checksums[1]
+    cache = PredictionCache(args.cache, hashlib.sha1(f"{mode}:{models}".encode()).hexdigest()[:16])
+
+    # Only the images whose outputs are not cached for these models go through the workers
+    image_keys = {path: file_checksum(path) for _, path, _ in samples}
+    predictions = {path: cache.load(key) for path, key in image_keys.items()}
+    missing = [path for path, prediction in predictions.items() if prediction is None]
+    print(f"{mode} {image_folder}: {len(samples)} images, {len(samples) - len(missing)} cached, "
+          f"{len(missing)} to run")
+
+    inferred, busy = 0, 0.0
+    start_time = time.perf_counter()
+    if missing:
+        shards = [(mode, missing[i:i + args.chunk], args.detect_batch) for i in range(0, len(missing), args.chunk)]
+        for pid, shard_predictions, seconds in pool().imap_unordered(predict_shard, shards):
+            for path, prediction in shard_predictions:
+                cache.save(image_keys[path], prediction)
+                predictions[path] = prediction
+            inferred += len(shard_predictions)
+            busy += seconds
+    elapsed = time.perf_counter() - start_time
+
+    # Unreadable images have no prediction, they count as misses
+    kept = [(name, path, label) for name, path, label in samples if predictions.get(path) is not None]
+    decode_start = time.perf_counter()
+    texts = decode_predictions([predictions[path] for _, path, _ in kept])
+    decode_seconds = time.perf_counter() - decode_start
+
+    names = [name for name, _, _ in kept]
+    truths = [normalize_plate(read_plate_characters(label)) for _, _, label in kept]
+    report, mismatches = score(names, truths, [normalize_plate(text) for text in texts])
+    report.update({
+        'mode': mode,
+        'images_folder': image_folder,
+        'inferred': inferred,
+        'fps': inferred / elapsed if inferred else None,
+        'worker_fps': inferred / busy if busy else None,
+        'decode_ms_per_image': decode_seconds * 1000 / max(len(kept), 1),
+    })
+    return report, [(mode,) + mismatch for mismatch in mismatches]
+
+def print_report(report):
+    fps = f"{report['fps']:.2f}" if report['fps'] else '-'
+    worker_fps = f"{report['worker_fps']:.2f}" if report['worker_fps'] else '-'
+    print(f"{report['mode']:<6}{report['images']:>8}{report['exact_match']:>10.2%}{report['cer']:>8.2%}"
+          f"{report['no_plate']:>10}{report['inferred']:>10}{fps:>10}{worker_fps:>12}"
+          f"{report['decode_ms_per_image']:>12.3f}  {report['images_folder']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the plate strings read by the whole pipeline against text labels.")
+    parser.add_argument('--full', nargs=2, action='append', default=[], metavar=('IMAGES', 'TEXT_LABELS'),
+                        help="Full frames (e.g. Data/Detection) run through the detector and the recognizer")
+    parser.add_argument('--crops', nargs=2, action='append', default=[], metavar=('IMAGES', 'TEXT_LABELS'),
+                        help="Plate crops (e.g. Data/OCR) run through the recognizer only")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--chunk', type=int, default=64, help="Images per shard")
+    parser.add_argument('--detect-batch', type=int, default=8, help="Frames per detector call")
+    parser.add_argument('--cache', default=current_path + '/.eval_cache', help="Folder of the cached predictions")
+    parser.add_argument('--output', default=None, help="Write the reports to this JSON file")
+    parser.add_argument('--errors', default=None, help="Write the mismatched plates to this CSV file")
+    parser.add_argument('--detector', default=current_path + '/Model/LP_Detect_YOLOv11n.pt')
+    parser.add_argument('--recognizer', default=current_path + '/Model/LP_Recog_YOLOv11n.pt')
+    args = parser.parse_args()
+
+    sets = [(FULL, images, labels) for images, labels in args.full] + \
+           [(CROPS, images, labels) for images, labels in args.crops]
+    if not sets:
+        parser.error("give at least one --full or --crops set")
+
+    model_checksums = (file_checksum(args.detector), file_checksum(args.recognizer))
+
+    # The pool is only started when some predictions are missing from the cache
+    workers = {}
+
+    def pool():
+        if 'pool' not in workers:
+            threads = max(1, (os.cpu_count() or 1) // args.workers)
+            context = multiprocessing.get_context('spawn')  # Forking a process holding torch threads is unsafe
+            workers['pool'] = context.Pool(args.workers, initializer=init_model_worker,
+                                           initargs=(args.detector, args.recognizer, threads))
+        return workers['pool']
+
+    reports, mismatches = [], []
+    try:
+        for mode, images, labels in sets:
+            report, set_mismatches = evaluate_set(mode, images, labels, args, model_checksums, pool)
+            if report is not None:
+                reports.append(report)
+                mismatches.extend(set_mismatches)
+    finally:
+        if 'pool' in workers:
+            workers['pool'].close()
+            workers['pool'].join()
+
+    print(f"\n{'mode':<6}{'images':>8}{'exact':>10}{'CER':>8}{'no plate':>10}{'inferred':>10}{'fps':>10}"
+          f"{'worker fps':>12}{'decode ms':>12}")
+    for report in reports:
+        print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=2)
+
+    if args.errors:
+        with open(args.errors, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['mode', 'image', 'truth', 'predicted', 'distance'])
+            writer.writerows(mismatches)
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,48 @@ CREATE TABLE IF NOT EXISTS parking_users (
     plate VARCHAR(255) NOT NULL,
     user_name VARCHAR(255) NOT NULL,
     msv INTEGER NOT NULL
-);
\ No newline at end of file
+);
+
+-- Plates are stored normalized (upper case letters and digits), registrations upsert on them.
+-- Databases created before the index may hold unnormalized or duplicate plates: they are
+-- normalized and only the latest registration of every plate is kept before creating it.
+DO $$
+BEGIN
+    IF to_regclass('parking_users_plate_key') IS NULL THEN
+        LOCK TABLE parking_users IN SHARE ROW EXCLUSIVE MODE;
+        UPDATE parking_users SET plate = upper(regexp_replace(plate, '[^[:alnum:]]', '', 'g'))
+            WHERE plate <> upper(regexp_replace(plate, '[^[:alnum:]]', '', 'g'));
+        DELETE FROM parking_users older USING parking_users newer
+            WHERE older.plate = newer.plate AND older.id_user < newer.id_user;
+        CREATE UNIQUE INDEX parking_users_plate_key ON parking_users (plate);
+    END IF;
+END
+$$;
+
+-- Notify the app's in-memory verification index whenever the table changes
+CREATE OR REPLACE FUNCTION notify_parking_users_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('parking_users_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS parking_users_changed ON parking_users;
+CREATE TRIGGER parking_users_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON parking_users
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_parking_users_changed();
+
+-- Every plate recognized at the gates, written in batches by the app
+CREATE TABLE IF NOT EXISTS access_events (
+    id_event BIGSERIAL PRIMARY KEY,
+    plate VARCHAR(255) NOT NULL,
+    camera_id VARCHAR(255) NOT NULL,
+    track_id INTEGER,
+    seen_at TIMESTAMPTZ NOT NULL,
+    confidence REAL NOT NULL,
+    verified BOOLEAN NOT NULL,
+    crop_path TEXT
+);
+
+CREATE INDEX IF NOT EXISTS access_events_seen_at_idx ON access_events (seen_at);
+CREATE INDEX IF NOT EXISTS access_events_plate_idx ON access_events (plate, seen_at);
\ No newline at end of file
@@ -0,0 +1,83 @@
+import sys
+import os
+
+current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(current_path)
+
+import argparse
+import asyncio
+import time
+
+import aiohttp
+import numpy as np
+
+from utils.backends import sample_images
+
+# Function to send requests from `concurrency` clients until `requests` were sent
+async def run_level(session, url, images, concurrency, requests):
+    latencies, statuses = [], {}
+    sent = 0
+
+    async def client():
+        nonlocal sent
+        while sent < requests:
+            body = images[sent % len(images)]
+            sent += 1
+            start_time = time.perf_counter()
+            try:
+                async with session.post(url, data=body, headers={'Content-Type': 'image/jpeg'}) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError:
+                status = 'error'
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99)) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        'concurrency': concurrency,
+        'ok': statuses.get(200, 0),
+        'shed': statuses.get(429, 0),
+        'failed': sum(count for status, count in statuses.items() if status not in (200, 429)),
+        'rps': statuses.get(200, 0) / elapsed,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+    }
+
+async def run(url, images, levels, requests):
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(limit=max(levels))
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        print(f"{'clients':>8}{'ok':>8}{'429':>8}{'failed':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for concurrency in levels:
+            row = await run_level(session, url, images, concurrency, requests)
+            print(f"{row['concurrency']:>8}{row['ok']:>8}{row['shed']:>8}{row['failed']:>8}{row['rps']:>10.2f}"
+                  f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test App/service.py at increasing concurrency.")
+    parser.add_argument('--url', default='http://localhost:8000/recognize')
+    parser.add_argument('--images', default=current_path + '/Data/Detection/images/val', help="Folder of test images")
+    parser.add_argument('--image-count', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--requests', type=int, default=200, help="Requests per concurrency level")
+    args = parser.parse_args()
+
+    images = []
+    for path in sample_images(args.images, args.image_count):
+        with open(path, 'rb') as file:
+            images.append(file.read())
+    if not images:
+        sys.exit(f"No images found in {args.images}")
+
+    asyncio.run(run(args.url, images, args.concurrency, args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import sys
+import os
+
+current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(current_path)
+
+import argparse
+import json
+import time
+
+from utils.multistream import MultiStreamRunner
+from utils.stream import BLOCK, DROP_OLDEST, FrameSampler
+from utils.backends import BACKENDS, TORCH, load_pipeline_models
+from utils.profiling import StageTimer
+from utils.recognition_cache import RecognitionCache
+
+# Function to tell video files from live cameras (URLs and device indexes)
+def is_video_file(source):
+    return os.path.isfile(source)
+
+# Function to print a JSON line whenever the voted text of a plate changes
+def make_printer():
+    printed = {}
+
+    def on_result(stream_id, frame, plates):
+        for plate in plates:
+            key = (stream_id, plate['track_id'])
+            if not plate['text'] or printed.get(key) == plate['text']:
+                continue
+            printed[key] = plate['text']
+            print(json.dumps({'stream': stream_id, 'plate': plate['text'],
+                              'confidence': round(plate['confidence'], 3), 'track_id': plate['track_id'],
+                              'box': [int(v) for v in plate['box']]}), flush=True)
+
+    return on_result
+
+def print_stats(runner, timer, elapsed):
+    frames = sum(stream.processed for stream in runner.streams.values())
+    for stream_id, stream in runner.streams.items():
+        print(f"{stream_id}: {stream.processed} frames, {stream.processed / elapsed:.2f} frames/sec, "
+              f"{stream.frames.dropped} dropped", file=sys.stderr)
+    batch = timer.summary().get('batch')
+    if batch:
+        print(f"{runner.batches} batches of {frames / max(runner.batches, 1):.2f} frames, "
+              f"p50 {batch['p50_ms']:.1f}ms p95 {batch['p95_ms']:.1f}ms, "
+              f"{frames / elapsed:.2f} frames/sec in total", file=sys.stderr)
+    cache = runner.recognition_cache
+    if cache is not None:
+        print(f"recognition cache: {cache.hit_rate:.1%} hits, {len(cache)} plates", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several cameras or videos on one shared detector and recognizer.")
+    parser.add_argument('sources', nargs='+', help="Camera URLs, device indexes or video files")
+    parser.add_argument('--max-batch', type=int, default=8, help="Maximum frames per batch")
+    parser.add_argument('--max-wait', type=float, default=0.02, help="Seconds a frame waits for others to join its batch")
+    parser.add_argument('--target-fps', type=float, default=None, help="Sampled frames per second of the video files")
+    parser.add_argument('--recognition-cache', action='store_true', help="Reuse the text of plate crops already read by any camera")
+    parser.add_argument('--no-track', action='store_true', help="Recognize every plate of every frame")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument('--stats-interval', type=float, default=10.0)
+    parser.add_argument('--backend', default=TORCH, choices=BACKENDS)
+    parser.add_argument('--int8', action='store_true')
+    args = parser.parse_args()
+
+    detector, recognizer = load_pipeline_models(current_path + '/Model', args.backend, args.int8,
+                                                data_folder=current_path + '/Data')
+
+    timer = StageTimer()
+    recognition_cache = RecognitionCache() if args.recognition_cache else None
+    runner = MultiStreamRunner(detector, recognizer, args.max_batch, args.max_wait, annotate=False,
+                               on_result=make_printer(), timer=timer, recognition_cache=recognition_cache)
+    for index, source in enumerate(args.sources):
+        if is_video_file(source):
+            # Every sampled frame of a file is processed, the capture waits for the scheduler
+            sampler = FrameSampler(target_fps=args.target_fps) if args.target_fps else None
+            runner.add_stream(f'{index}:{os.path.basename(source)}', source, capture_size=4,
+                              capture_policy=BLOCK, sampler=sampler, track=not args.no_track)
+        else:
+            source = int(source) if source.isdigit() else source
+            runner.add_stream(f'{index}:{source}', source, capture_size=1, capture_policy=DROP_OLDEST,
+                              track=not args.no_track)
+
+    start_time = time.perf_counter()
+    last_stats = start_time
+    runner.start()
+    try:
+        while runner.running:
+            time.sleep(0.5)
+            now = time.perf_counter()
+            if args.duration is not None and now - start_time >= args.duration:
+                break
+            if now - last_stats >= args.stats_interval:
+                print_stats(runner, timer, now - start_time)
+                last_stats = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.stop()
+
+    print_stats(runner, timer, time.perf_counter() - start_time)
+    for stream_id, stream in runner.streams.items():
+        if stream.error is not None:
+            print(f"{stream_id}: {stream.error}", file=sys.stderr)
+    if runner.error is not None:
+        sys.exit(f"Scheduler failed: {runner.error}")
+
+if __name__ == "__main__":
+    main()
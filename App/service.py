@@ -0,0 +1,228 @@
+import sys
+import os
+
+current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(current_path)
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from aiohttp import web
+
+from utils.utils import recognize_plates_batch
+from utils.backends import BACKENDS, TORCH, load_pipeline_models
+from utils.database import ConnectionPool, VerificationCache, apply_schema
+from utils.profiling import StageTimer
+
+# Same verification thresholds as the app: look-alike characters cost 0.3, any other edit 1
+FUZZY_ACCEPT_DISTANCE = 0.3
+FUZZY_CONFIRM_DISTANCE = 1.0
+
+class MicroBatcher:
+    """
+    Groups the frames of concurrent requests into single model calls.
+
+    Requests wait in a bounded queue. One worker takes the first waiting frame, gathers more for
+    at most `max_wait` seconds (or until `max_batch` frames) and runs them as one batch on a
+    dedicated inference thread, so the event loop keeps accepting requests meanwhile. When the
+    queue is full `submit` raises asyncio.QueueFull and the request is shed.
+
+    Args:
+        detector: License plate detection YOLO model
+        recognizer: Character recognition YOLO model
+        max_batch (int): Maximum number of frames per model call
+        max_wait (float): Maximum seconds the first frame of a batch waits for more frames
+        queue_size (int): Maximum number of frames waiting for inference
+        timer (StageTimer): Records the stages of every batch
+    """
+
+    def __init__(self, detector, recognizer, max_batch=8, max_wait=0.01, queue_size=64, timer=None):
+        self.detector = detector
+        self.recognizer = recognizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timer = timer or StageTimer()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batches = 0
+        self.frames = 0
+
+        # The models are only ever called from this thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        self._executor.shutdown(wait=False)
+
+    def submit(self, frame, deadline):
+        """Queues a frame, returns the future of its plates. Raises asyncio.QueueFull when overloaded."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((frame, deadline, future))
+        return future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+
+            # Requests that already timed out are not worth a model call
+            now = time.monotonic()
+            batch = [item for item in batch if not item[2].done() and item[1] > now]
+            if not batch:
+                continue
+
+            frames = [frame for frame, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, recognize_plates_batch, frames,
+                                                     self.detector, self.recognizer, None, self.timer)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.frames += len(batch)
+            for (_, _, future), plates in zip(batch, results):
+                if not future.done():
+                    future.set_result(plates)
+
+# Function to attach the verification result to every recognized plate
+def verify_plates(plates, cache):
+    verified = []
+    for plate in plates:
+        result = {
+            'text': plate['text'],
+            'confidence': round(float(plate['confidence']), 4),
+            'box': [int(v) for v in plate['box']],
+            'verified': None,
+        }
+        if cache is not None and plate['text']:
+            matches = cache.match(plate['text'], FUZZY_CONFIRM_DISTANCE)
+            result['verified'] = bool(matches) and matches[0][1] <= FUZZY_ACCEPT_DISTANCE
+            if matches:
+                registered_plate, distance, (user_name, msv) = matches[0]
+                result.update(registered_plate=registered_plate, distance=distance,
+                              owner={'user_name': user_name, 'msv': msv})
+        verified.append(result)
+    return verified
+
+async def handle_recognize(request):
+    """POST /recognize with a JPEG/PNG body, returns the plates with their verification."""
+    start_time = time.perf_counter()
+    app = request.app
+
+    data = await request.read()
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+    if frame is None:
+        raise web.HTTPBadRequest(text="Body is not a decodable image")
+
+    timeout = app['timeout']
+    try:
+        future = app['batcher'].submit(frame, time.monotonic() + timeout)
+    except asyncio.QueueFull:
+        app['shed'] += 1
+        raise web.HTTPTooManyRequests(text="Inference queue full", headers={'Retry-After': '1'})
+
+    try:
+        plates = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        app['timed_out'] += 1
+        raise web.HTTPGatewayTimeout(text=f"No result within {timeout}s")
+
+    return web.json_response({
+        'plates': verify_plates(plates, app['cache']),
+        'latency_ms': round((time.perf_counter() - start_time) * 1000, 2),
+    })
+
+async def handle_health(request):
+    """GET /health, queue depth, shed requests and stage latencies."""
+    app = request.app
+    batcher = app['batcher']
+    return web.json_response({
+        'queued': batcher.queue.qsize(),
+        'batches': batcher.batches,
+        'frames': batcher.frames,
+        'mean_batch': batcher.frames / batcher.batches if batcher.batches else 0.0,
+        'shed': app['shed'],
+        'timed_out': app['timed_out'],
+        'registrations': len(app['cache']) if app['cache'] is not None else None,
+        'stages': batcher.timer.summary(),
+    })
+
+def create_app(detector, recognizer, cache=None, max_batch=8, max_wait=0.01, queue_size=64, timeout=5.0):
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app['batcher'] = MicroBatcher(detector, recognizer, max_batch, max_wait, queue_size)
+    app['cache'] = cache
+    app['timeout'] = timeout
+    app['shed'] = 0
+    app['timed_out'] = 0
+
+    async def on_startup(app):
+        app['batcher'].start()
+
+    async def on_cleanup(app):
+        await app['batcher'].stop()
+        if app['cache'] is not None:
+            app['cache'].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post('/recognize', handle_recognize)
+    app.router.add_get('/health', handle_health)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP service recognizing and verifying the license plates of posted images.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=8, help="Maximum frames per model call")
+    parser.add_argument('--max-wait', type=float, default=0.01, help="Seconds a request waits for others to join its batch")
+    parser.add_argument('--queue-size', type=int, default=64, help="Waiting requests above which new ones get a 429")
+    parser.add_argument('--timeout', type=float, default=5.0, help="Seconds before a request gets a 504")
+    parser.add_argument('--backend', default=TORCH, choices=BACKENDS)
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--db-name', default=os.environ.get('LP_DB_NAME'), help="Without a database the plates are not verified")
+    parser.add_argument('--db-host', default=os.environ.get('LP_DB_HOST', 'localhost'))
+    parser.add_argument('--db-user', default=os.environ.get('LP_DB_USER', 'postgres'))
+    parser.add_argument('--db-password', default=os.environ.get('LP_DB_PASSWORD'))
+    parser.add_argument('--db-port', default=os.environ.get('LP_DB_PORT', '5432'))
+    args = parser.parse_args()
+
+    detector, recognizer = load_pipeline_models(current_path + '/Model', args.backend, args.int8,
+                                                data_folder=current_path + '/Data')
+
+    cache = None
+    if args.db_name:
+        pool = ConnectionPool(database=args.db_name, host=args.db_host, user=args.db_user,
+                              password=args.db_password, port=args.db_port)
+        with pool.connection() as conn:
+            apply_schema(conn)
+        cache = VerificationCache(pool.getconn, pool.putconn).start()
+
+    web.run_app(create_app(detector, recognizer, cache, args.max_batch, args.max_wait, args.queue_size,
+                           args.timeout), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import sys
+import os
+
+current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(current_path)
+
+import argparse
+import time
+
+import numpy as np
+
+from utils.utils import sort_boxes_batch, sort_boxes_top_to_down_left_to_right
+from ordering_reference import reference_sort_boxes
+from plates import make_batch
+
+# Function to time a sort over every plate of the batch, best of `repeat` runs
+def best_time(sort, repeat):
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        sort()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the character ordering against the former loop.")
+    parser.add_argument('--plates', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--two-lines', type=float, default=0.3, help="Fraction of two-line plates")
+    parser.add_argument('--jitter', type=float, default=0.1, help="Vertical jitter, fraction of the character height")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'plates':>8}{'loop ms':>12}{'per plate ms':>14}{'batch ms':>12}{'speedup':>10}{'misordered old/new':>22}")
+    for count in args.plates:
+        boxes, classes, lengths = make_batch(rng, count, args.two_lines, args.jitter)
+        plates = [(boxes[i, :length], classes[i, :length]) for i, length in enumerate(lengths)]
+
+        loop = best_time(lambda: [reference_sort_boxes(*plate) for plate in plates], args.repeat)
+        single = best_time(lambda: [sort_boxes_top_to_down_left_to_right(*plate) for plate in plates], args.repeat)
+        batch = best_time(lambda: sort_boxes_batch(boxes, classes, lengths), args.repeat)
+
+        old = sum(list(reference_sort_boxes(*plate)[1]) != list(range(len(plate[1]))) for plate in plates)
+        _, sorted_classes = sort_boxes_batch(boxes, classes, lengths)
+        new = sum(list(sorted_classes[i, :length]) != list(range(length)) for i, length in enumerate(lengths))
+
+        print(f"{count:>8}{loop * 1000:>12.1f}{single * 1000:>14.1f}{batch * 1000:>12.2f}{loop / batch:>9.0f}x"
+              f"{f'{old}/{new}':>22}")
+
+if __name__ == "__main__":
+    main()
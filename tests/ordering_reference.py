@@ -0,0 +1,44 @@
+import numpy as np
+
+# sort_boxes_top_to_down_left_to_right as it was before order_boxes_batch, kept to test and
+# benchmark the vectorized ordering against it
+def reference_sort_boxes(boxes, classes):
+    # Step 1: Sort by the `y_min` (top edge of bounding box) to get top-to-down order
+    sorted_indices = np.argsort(boxes[:, 1])  # Sort by `y_min` (index 1)
+    boxes = boxes[sorted_indices]
+    classes = classes[sorted_indices]
+
+    # Step 2: Within each row (roughly same y_min), sort by `x_min` (left edge of bounding box)
+    sorted_boxes = []
+    sorted_classes = []
+
+    # Define a threshold to consider "rows" (adjust based on your images)
+    row_threshold = 0.1 * (np.max(boxes[:, 3]) - np.min(boxes[:, 1]))  # 10% of plate height
+
+    current_row = []
+    current_classes = []
+
+    last_y_min = boxes[0][1]
+
+    for i, box in enumerate(boxes):
+        if abs(box[1] - last_y_min) > row_threshold:  # Start a new row
+            # Sort the current row by `x_min` (left edge of bounding box)
+            sorted_row_indices = np.argsort(np.array(current_row)[:, 0])
+            sorted_boxes.extend(np.array(current_row)[sorted_row_indices])
+            sorted_classes.extend(np.array(current_classes)[sorted_row_indices])
+
+            # Reset for the new row
+            current_row = [box]
+            current_classes = [classes[i]]
+            last_y_min = box[1]
+        else:
+            # Add to the current row
+            current_row.append(box)
+            current_classes.append(classes[i])
+
+    # Sort the last row
+    sorted_row_indices = np.argsort(np.array(current_row)[:, 0])
+    sorted_boxes.extend(np.array(current_row)[sorted_row_indices])
+    sorted_classes.extend(np.array(current_classes)[sorted_row_indices])
+
+    return sorted_boxes, sorted_classes
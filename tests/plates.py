@@ -0,0 +1,51 @@
+import numpy as np
+
+def make_plate(rng, two_lines=False, jitter=0.0):
+    """
+    Random character boxes of a plate, in reading order.
+
+    Args:
+        rng (np.random.Generator): Random generator
+        two_lines (bool): Two rows of characters (square plates) instead of one
+        jitter (float): Vertical jitter of every box, as a fraction of the character height
+
+    Returns:
+        boxes (np.ndarray): (N, 4) boxes (x_min, y_min, x_max, y_max) in reading order
+    """
+    height = rng.uniform(10, 60)
+    width = height * rng.uniform(0.45, 0.6)
+    step = width * rng.uniform(1.1, 1.4)
+    rows = [int(rng.integers(3, 5)), int(rng.integers(4, 6))] if two_lines else [int(rng.integers(7, 10))]
+
+    boxes = []
+    x0, y0 = rng.uniform(0, 50, size=2)
+    for row, count in enumerate(rows):
+        top = y0 + row * height * rng.uniform(1.15, 1.4)
+        for i in range(count):
+            h = height * rng.uniform(0.9, 1.1)
+            y = top + jitter * height * rng.uniform(-1, 1)
+            x = x0 + i * step
+            boxes.append((x, y, x + width, y + h))
+    return np.array(boxes, dtype=np.float32)
+
+def make_batch(rng, count, two_lines_ratio=0.3, jitter=0.0):
+    """
+    Random plates padded into a batch, the boxes of every plate shuffled.
+
+    The class of every box is its position in reading order, so a correctly sorted plate has the
+    classes 0, 1, 2...
+
+    Returns:
+        boxes (np.ndarray): (B, N, 4) boxes, padded to N
+        classes (np.ndarray): (B, N) classes, padded to N
+        lengths (np.ndarray): (B,) number of characters of every plate
+    """
+    plates = [make_plate(rng, rng.random() < two_lines_ratio, jitter) for _ in range(count)]
+    lengths = np.array([len(plate) for plate in plates])
+    boxes = np.zeros((count, lengths.max(), 4), dtype=np.float32)
+    classes = np.zeros((count, lengths.max()), dtype=np.int64)
+    for i, plate in enumerate(plates):
+        shuffle = rng.permutation(len(plate))
+        boxes[i, :len(plate)] = plate[shuffle]
+        classes[i, :len(plate)] = shuffle
+    return boxes, classes, lengths
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from utils.utils import crop_image_with_labels
+
+def write_sample(folder, boxes):
+    image_path = os.path.join(folder, 'car.jpg')
+    Image.fromarray(np.zeros((100, 200, 3), dtype=np.uint8)).save(image_path)
+    label_path = os.path.join(folder, 'car_label.txt')
+    with open(label_path, 'w') as file:
+        file.writelines(f"0 {0.2 + 0.3 * i} 0.5 0.2 0.2\n" for i in range(boxes))
+    text_label_path = os.path.join(folder, 'car_text.txt')
+    with open(text_label_path, 'w') as file:
+        file.write('51A12345\n')
+    return image_path, label_path, text_label_path
+
+def test_recrop_removes_the_crops_of_removed_boxes(tmp_path):
+    output_folder = tmp_path / 'crops'
+    output_folder.mkdir()
+
+    assert crop_image_with_labels('car', *write_sample(str(tmp_path), 3), str(output_folder)) == 3
+    assert sorted(os.listdir(output_folder)) == ['car.jpg', 'car.txt', 'car_1.jpg', 'car_1.txt',
+                                                 'car_2.jpg', 'car_2.txt']
+
+    # The label now has a single box, the other crops must not reach the dataset
+    assert crop_image_with_labels('car', *write_sample(str(tmp_path), 1), str(output_folder)) == 1
+    assert sorted(os.listdir(output_folder)) == ['car.jpg', 'car.txt']
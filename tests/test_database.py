@@ -0,0 +1,96 @@
+import io
+import sqlite3
+import threading
+
+import pytest
+
+from utils.database import VerificationCache, read_registrations_csv
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'users.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE parking_users (id_user INTEGER PRIMARY KEY, plate TEXT NOT NULL, "
+                 "user_name TEXT NOT NULL, msv INTEGER NOT NULL)")
+    conn.commit()
+    yield conn, lambda: sqlite3.connect(path, check_same_thread=False)
+    conn.close()
+
+def insert(conn, id_user, plate, user_name='owner', msv=1):
+    conn.execute("INSERT INTO parking_users VALUES (?, ?, ?, ?)", (id_user, plate, user_name, msv))
+    conn.commit()
+
+def test_incremental_refresh_reads_new_rows(database):
+    conn, connect = database
+    insert(conn, 1, '51A12345')
+    cache = VerificationCache(connect, placeholder='?')
+    assert cache.refresh()
+    insert(conn, 2, '30E-999.99', 'other', 2)
+
+    assert cache.refresh()
+    assert cache.lookup('30E99999') == ('other', 2)
+    assert cache.last_id == 2
+
+def test_refresh_reads_ids_committed_out_of_order(database):
+    # Two registrations start together, the one with the lower id commits last
+    conn, connect = database
+    cache = VerificationCache(connect, placeholder='?')
+    assert cache.refresh(full=True)
+    insert(conn, 2, '51A12345')
+    assert cache.refresh()
+    insert(conn, 1, '30E99999')
+
+    assert cache.refresh()
+    assert not cache._full_reload and cache._refreshes == 2
+    assert cache.lookup('30E99999') == ('owner', 1)
+
+def test_ids_older_than_overlap_are_not_read_again(database):
+    conn, connect = database
+    insert(conn, 1, '51A12345')
+    cache = VerificationCache(connect, placeholder='?', overlap=0.0)
+    assert cache.refresh(full=True)
+    assert cache._reread_from(float('inf')) == 1
+
+    # A row hidden below the last id is only picked up by the next full reload
+    insert(conn, 0, '30E99999')
+    assert cache.refresh()
+    assert cache.lookup('30E99999') is None
+    assert cache.refresh(full=True)
+    assert cache.lookup('30E99999') == ('owner', 1)
+
+def test_concurrent_refreshes_keep_added_plates(database):
+    conn, connect = database
+    for id_user in range(1, 51):
+        insert(conn, id_user, f'51A{id_user:05d}')
+    cache = VerificationCache(connect, placeholder='?')
+    assert cache.refresh(full=True)
+
+    def refresh():
+        for _ in range(20):
+            cache.refresh()
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    writer = connect()
+    for i in range(200):
+        # Registrations are committed, then added to the cache of the process that made them
+        insert(writer, 100 + i, f'29B{i:05d}', 'added', i)
+        cache.add(f'29B{i:05d}', 'added', i)
+    writer.close()
+    for thread in threads:
+        thread.join()
+
+    assert all(cache.lookup(f'29B{i:05d}') == ('added', i) for i in range(200))
+    assert len(cache) == 250
+    assert cache.match('29B00007', max_distance=0)[0][0] == '29B00007'
+
+def test_registrations_csv_with_byte_order_mark(tmp_path):
+    # Excel starts its UTF-8 CSV files with a byte order mark
+    data = '\ufeffplate,user_name,msv\r\n51a-123.45, Nguyen Van A ,1\r\n'.encode('utf-8')
+    path = tmp_path / 'users.csv'
+    path.write_bytes(data)
+
+    expected = [('51A12345', 'Nguyen Van A', 1)]
+    assert read_registrations_csv(str(path)) == expected
+    assert read_registrations_csv(io.BytesIO(data)) == expected
@@ -0,0 +1,99 @@
+import sqlite3
+import time
+
+import pytest
+
+from utils.events import AccessEventWriter, PlateEventLogger
+
+@pytest.fixture
+def connect(tmp_path):
+    path = str(tmp_path / 'events.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE access_events (id_event INTEGER PRIMARY KEY, plate TEXT NOT NULL, "
+                 "camera_id TEXT NOT NULL, track_id INTEGER, seen_at TEXT NOT NULL, confidence REAL NOT NULL, "
+                 "verified BOOLEAN NOT NULL, crop_path TEXT)")
+    conn.commit()
+    conn.close()
+
+    def connect():
+        connect.calls += 1
+        return sqlite3.connect(path, check_same_thread=False)
+
+    connect.calls = 0
+    connect.path = path
+    return connect
+
+def stored_plates(connect):
+    conn = sqlite3.connect(connect.path)
+    rows = [row[0] for row in conn.execute("SELECT plate FROM access_events ORDER BY id_event")]
+    conn.close()
+    return rows
+
+def test_flush_writes_in_batches(connect):
+    writer = AccessEventWriter(connect, batch_size=3, placeholder='?')
+    for i in range(7):
+        assert writer.log(f'51A{i:05d}', 'gate', 0.9, True)
+
+    assert writer.flush()
+    assert connect.calls == 3  # 3 + 3 + 1 events
+    assert writer.written == 7 and writer.pending == 0
+    assert stored_plates(connect) == [f'51A{i:05d}' for i in range(7)]
+
+def test_full_batch_is_flushed_without_waiting(connect):
+    writer = AccessEventWriter(connect, batch_size=5, flush_interval=30.0, placeholder='?').start()
+    try:
+        for i in range(5):
+            writer.log(f'51A{i:05d}', 'gate', 0.9, False)
+        deadline = time.monotonic() + 5
+        while writer.written < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert writer.written == 5
+    finally:
+        writer.stop()
+    assert connect.calls == 1
+
+def test_buffer_is_bounded(connect):
+    writer = AccessEventWriter(connect, max_pending=3, placeholder='?')
+    results = [writer.log(f'51A{i:05d}', 'gate', 0.9, True) for i in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert writer.pending == 3 and writer.dropped == 2
+    assert writer.flush()
+    assert stored_plates(connect) == ['51A00000', '51A00001', '51A00002']
+
+def test_failed_batch_is_kept_for_the_next_flush(connect):
+    def unreachable():
+        raise sqlite3.OperationalError("database is down")
+
+    writer = AccessEventWriter(unreachable, batch_size=2, placeholder='?')
+    for i in range(3):
+        writer.log(f'51A{i:05d}', 'gate', 0.9, True)
+    assert not writer.flush()
+    assert writer.pending == 3 and writer.failed_flushes == 1
+
+    writer.connect = connect
+    assert writer.flush()
+    assert stored_plates(connect) == ['51A00000', '51A00001', '51A00002']
+
+def test_logger_suppresses_duplicates(connect):
+    writer = AccessEventWriter(connect, placeholder='?')
+    logger = PlateEventLogger(writer, 'gate', verify=lambda plate: plate == '51A12345')
+
+    def plate(text, track_id):
+        return {'text': text, 'confidence': 0.9, 'track_id': track_id, 'box': (0, 0, 10, 10)}
+
+    # The same track seen on many frames is logged once, then again when its voted text changes
+    for _ in range(10):
+        logger([plate('51A12346', 1), plate('', 2)])
+    logger([plate('51A12345', 1)])
+    logger([plate('51A12345', 1)])
+    # Without a tracker the text itself is the key
+    logger([plate('30E99999', None)])
+    logger([plate('30E99999', None)])
+
+    assert writer.pending == 3
+    assert writer.flush()
+    conn = sqlite3.connect(connect.path)
+    rows = conn.execute("SELECT plate, camera_id, track_id, verified FROM access_events ORDER BY id_event").fetchall()
+    conn.close()
+    assert rows == [('51A12346', 'gate', 1, 0), ('51A12345', 'gate', 1, 1), ('30E99999', 'gate', None, 0)]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from utils.utils import (DECODE_LUT, DECODE_PLATE, decode_plate_batch, decode_plate_classes, sort_boxes_batch,
+                         sort_boxes_top_to_down_left_to_right)
+
+from ordering_reference import reference_sort_boxes
+from plates import make_batch
+
+def plates(boxes, classes, lengths):
+    for plate_boxes, plate_classes, length in zip(boxes, classes, lengths):
+        yield plate_boxes[:length], plate_classes[:length]
+
+@pytest.mark.parametrize('two_lines_ratio', [0.0, 1.0])
+def test_matches_reference_on_straight_plates(two_lines_ratio):
+    # Without vertical jitter the old row threshold splits the rows right
+    boxes, classes, lengths = make_batch(np.random.default_rng(0), 500, two_lines_ratio)
+    for plate_boxes, plate_classes in plates(boxes, classes, lengths):
+        _, expected = reference_sort_boxes(plate_boxes, plate_classes)
+        _, sorted_classes = sort_boxes_top_to_down_left_to_right(plate_boxes, plate_classes)
+        assert list(sorted_classes) == list(expected)
+
+@pytest.mark.parametrize('two_lines_ratio', [0.0, 1.0])
+def test_reads_jittered_plates_in_order(two_lines_ratio):
+    boxes, classes, lengths = make_batch(np.random.default_rng(1), 2000, two_lines_ratio, jitter=0.15)
+    _, sorted_classes = sort_boxes_batch(boxes, classes, lengths)
+    for plate_classes, length in zip(sorted_classes, lengths):
+        assert list(plate_classes[:length]) == list(range(length))
+
+def test_reference_misorders_jittered_single_line_plates():
+    # The reason for the character height threshold: a 10% of the plate extent threshold splits
+    # a single line into rows as soon as the characters are not perfectly aligned
+    boxes, classes, lengths = make_batch(np.random.default_rng(1), 500, 0.0, jitter=0.15)
+    misordered = sum(list(reference_sort_boxes(plate_boxes, plate_classes)[1]) != list(range(len(plate_classes)))
+                     for plate_boxes, plate_classes in plates(boxes, classes, lengths))
+    assert misordered > 0
+
+def test_batch_matches_single_plates():
+    boxes, classes, lengths = make_batch(np.random.default_rng(2), 300, 0.5, jitter=0.1)
+    batch_boxes, batch_classes = sort_boxes_batch(boxes, classes, lengths)
+    for i, (plate_boxes, plate_classes) in enumerate(plates(boxes, classes, lengths)):
+        sorted_boxes, sorted_classes = sort_boxes_top_to_down_left_to_right(plate_boxes, plate_classes)
+        np.testing.assert_array_equal(batch_boxes[i, :lengths[i]], sorted_boxes)
+        np.testing.assert_array_equal(batch_classes[i, :lengths[i]], sorted_classes)
+
+def test_empty_plates():
+    boxes, classes, lengths = make_batch(np.random.default_rng(3), 4)
+    lengths[1] = 0
+    _, sorted_classes = sort_boxes_batch(boxes, classes, lengths)
+    assert decode_plate_batch(sorted_classes, lengths)[1] == ''
+    assert sort_boxes_batch(np.zeros((2, 0, 4)), np.zeros((2, 0)), np.zeros(2, dtype=int))[1].shape == (2, 0)
+
+def test_decode_lookup_matches_dictionary():
+    classes = np.arange(len(DECODE_PLATE))
+    assert decode_plate_classes(classes) == ''.join(DECODE_PLATE[i] for i in classes)
+    assert decode_plate_batch(classes[None], [len(classes)]) == [''.join(DECODE_LUT)]
@@ -1 +1,12 @@
-from .utils import *
\ No newline at end of file
+from .utils import *
+from .stream import *
+from .database import *
+from .backends import *
+from .profiling import *
+from .packed import *
+from .events import *
+from .fuzzy import *
+from .multistream import *
+from .motion import *
+from .metrics import *
+from .recognition_cache import *
@@ -0,0 +1,311 @@
+import os
+import glob
+import random
+import time
+
+import numpy as np
+import cv2
+
+# Inference backends a model can be loaded with
+TORCH = 'torch'
+ONNX = 'onnx'
+OPENVINO = 'openvino'
+BACKENDS = (TORCH, ONNX, OPENVINO)
+
+# Input sizes the models were trained with (see the notebooks under Model/)
+DETECTOR_IMGSZ = 320
+RECOGNIZER_IMGSZ = 128
+
+def exported_path(weights, backend, int8=False):
+    """
+    Returns where the export of a .pt model for a backend is stored.
+
+    Args:
+        weights (str): Path of the PyTorch weights (.pt)
+        backend (str): One of BACKENDS
+        int8 (bool): Path of the INT8 quantized export
+
+    Returns:
+        path (str): File (ONNX) or folder (OpenVINO) of the exported model
+    """
+    base = os.path.splitext(weights)[0]
+    suffix = '_int8' if int8 else ''
+    if backend == TORCH:
+        return weights
+    if backend == ONNX:
+        return f"{base}{suffix}.onnx"
+    if backend == OPENVINO:
+        return f"{base}{suffix}_openvino_model"
+    raise ValueError(f"Unknown backend: {backend}")
+
+def letterbox(image, size):
+    """Resizes an image into a size x size square keeping its aspect ratio, padded with gray."""
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    resized = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))))
+
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return canvas
+
+def sample_images(image_folder, count, seed=0):
+    """Returns a reproducible random sample of the .jpg/.png images under a folder."""
+    paths = sorted(glob.glob(os.path.join(image_folder, '**', '*.jpg'), recursive=True)
+                   + glob.glob(os.path.join(image_folder, '**', '*.png'), recursive=True))
+    random.Random(seed).shuffle(paths)
+    return paths[:count]
+
+class ImageCalibrationReader:
+    """
+    Feeds calibration images to the ONNX Runtime static quantizer, preprocessed like ultralytics does.
+
+    Args:
+        input_name (str): Name of the model input
+        image_paths (list): Calibration images
+        imgsz (int): Input size of the model
+    """
+
+    def __init__(self, input_name, image_paths, imgsz):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.image_paths:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            image = letterbox(image, self.imgsz)[:, :, ::-1]  # BGR to RGB
+            tensor = np.ascontiguousarray(image.transpose(2, 0, 1), dtype=np.float32)[None] / 255
+            return {self.input_name: tensor}
+        return None
+
+def quantize_onnx(model_path, output_path, calibration_images, imgsz):
+    """
+    Statically quantizes an ONNX model to INT8, activations are calibrated on sample images.
+
+    Args:
+        model_path (str): FP32 ONNX model
+        output_path (str): Where to write the INT8 model
+        calibration_images (list): Images used to calibrate the activation ranges
+        imgsz (int): Input size of the model
+
+    Returns:
+        output_path (str): Path of the quantized model
+    """
+    import onnxruntime
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    reader = ImageCalibrationReader(input_name, calibration_images, imgsz)
+    quantize_static(model_path, output_path, reader, quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    return output_path
+
+def export_model(weights, backend, imgsz, int8=False, data=None, calibration_size=200):
+    """
+    Exports a .pt model to ONNX or OpenVINO, optionally quantized to INT8.
+
+    Args:
+        weights (str): Path of the PyTorch weights (.pt)
+        backend (str): ONNX or OPENVINO
+        imgsz (int): Input size of the model
+        int8 (bool): Quantize the model to INT8
+        data (str): data.yaml of the dataset the INT8 calibration images are sampled from
+        calibration_size (int): Number of calibration images
+
+    Returns:
+        path (str): Path of the exported model
+    """
+    from ultralytics import YOLO
+
+    if int8 and data is None:
+        raise ValueError("INT8 quantization needs a data.yaml to calibrate on")
+
+    target = exported_path(weights, backend, int8)
+    model = YOLO(weights)
+
+    # Dynamic shapes so that batched recognition works with the exported models too
+    if backend == OPENVINO:
+        path = model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=int8, data=data)
+    elif backend == ONNX:
+        path = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        if int8:
+            image_folder = os.path.join(os.path.dirname(data), 'images')
+            path = quantize_onnx(path, target, sample_images(image_folder, calibration_size), imgsz)
+    else:
+        raise ValueError(f"Cannot export to backend: {backend}")
+
+    if os.path.abspath(str(path)) != os.path.abspath(target) and os.path.exists(str(path)):
+        os.replace(str(path), target)
+    return target
+
+def load_model(weights, backend=TORCH, imgsz=None, int8=False, data=None):
+    """
+    Loads a model for a backend, exporting it on first use.
+
+    The returned object is always an ultralytics YOLO model, so process_frame and the other
+    pipeline functions work unchanged whatever the backend.
+
+    Args:
+        weights (str): Path of the PyTorch weights (.pt)
+        backend (str): One of BACKENDS
+        imgsz (int): Input size of the model, used for the export and for inference
+        int8 (bool): Use the INT8 quantized export, only available for ONNX and OpenVINO
+        data (str): data.yaml used to calibrate the INT8 export
+
+    Returns:
+        model: The loaded YOLO model
+    """
+    from ultralytics import YOLO
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}, expected one of {BACKENDS}")
+    if int8 and backend == TORCH:
+        raise ValueError(f"INT8 models are only available for {ONNX} and {OPENVINO}, not {TORCH}")
+
+    path = exported_path(weights, backend, int8)
+    if not os.path.exists(path):
+        path = export_model(weights, backend, imgsz, int8=int8, data=data)
+    model = YOLO(path, task='detect')
+
+    # The .pt weights carry their training size, dynamic exports would otherwise predict at 640
+    if backend != TORCH and imgsz is not None:
+        model.overrides['imgsz'] = imgsz
+    return model
+
+def load_pipeline_models(model_folder, backend=TORCH, int8=False, data_folder=None):
+    """
+    Loads the detector and the recognizer of the project for a backend.
+
+    Args:
+        model_folder (str): Folder holding LP_Detect_YOLOv11n.pt and LP_Recog_YOLOv11n.pt
+        backend (str): One of BACKENDS
+        int8 (bool): Use INT8 quantized exports
+        data_folder (str): Folder holding the Detection and OCR datasets, used for INT8 calibration
+
+    Returns:
+        detector, recognizer: The loaded YOLO models
+    """
+    detection_data = os.path.join(data_folder, 'Detection', 'data.yaml') if data_folder else None
+    ocr_data = os.path.join(data_folder, 'OCR', 'data.yaml') if data_folder else None
+
+    detector = load_model(os.path.join(model_folder, 'LP_Detect_YOLOv11n.pt'), backend,
+                          DETECTOR_IMGSZ, int8, detection_data)
+    recognizer = load_model(os.path.join(model_folder, 'LP_Recog_YOLOv11n.pt'), backend,
+                            RECOGNIZER_IMGSZ, int8, ocr_data)
+    return detector, recognizer
+
+# Models of a worker process, loaded once by init_model_worker
+_worker_models = (None, None)
+
+def init_model_worker(detector_path, recognizer_path, threads):
+    """
+    Pool initializer loading the detector and the recognizer of a worker process.
+
+    Every worker owns a slice of the CPU (`threads` torch threads) instead of all workers fighting
+    over all cores. The worker functions get the models back with worker_models.
+    """
+    global _worker_models
+
+    import torch
+    from ultralytics import YOLO
+
+    torch.set_num_threads(threads)
+    _worker_models = (YOLO(detector_path), YOLO(recognizer_path))
+
+def worker_models():
+    """Returns the (detector, recognizer) loaded by init_model_worker in this process."""
+    return _worker_models
+
+def compare_backends(image_paths, model_folder, configs, data_folder=None, label_folder=None, warmup=5):
+    """
+    Compares the latency and the plate texts of several backends against the torch baseline.
+
+    Args:
+        image_paths (list): Frames to run the full pipeline on
+        model_folder (str): Folder holding the .pt models
+        configs (list): (backend, int8) pairs to compare, the torch baseline is always added first
+        data_folder (str): Dataset folder used for INT8 calibration
+        label_folder (str): Optional folder of text labels (same name as the image, .txt) for accuracy
+        warmup (int): Number of frames run before timing
+
+    Returns:
+        report (list): One dictionary per config with latency percentiles, agreement with torch
+            and, if labels are given, the exact match accuracy
+    """
+    from .utils import read_plate_characters, recognize_plates
+
+    frames = [(path, cv2.imread(path)) for path in image_paths]
+    frames = [(path, frame) for path, frame in frames if frame is not None]
+
+    ground_truth = {}
+    if label_folder is not None:
+        for path, _ in frames:
+            label_path = os.path.join(label_folder, os.path.splitext(os.path.basename(path))[0] + '.txt')
+            if os.path.exists(label_path):
+                ground_truth[path] = read_plate_characters(label_path)
+
+    configs = [(TORCH, False)] + [config for config in configs if config != (TORCH, False)]
+    baseline = None
+    report = []
+
+    for backend, int8 in configs:
+        detector, recognizer = load_pipeline_models(model_folder, backend, int8, data_folder)
+        for _, frame in frames[:warmup]:
+            recognize_plates(frame, detector, recognizer)
+
+        latencies = []
+        texts = {}
+        for path, frame in frames:
+            start_time = time.perf_counter()
+            plates = recognize_plates(frame, detector, recognizer)
+            latencies.append(time.perf_counter() - start_time)
+            texts[path] = ' '.join(sorted(plate['text'] for plate in plates if plate['text']))
+
+        if baseline is None:
+            baseline = texts
+
+        latencies = np.array(latencies) * 1000
+        row = {
+            'backend': backend + (' int8' if int8 else ''),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'fps': float(1000 / latencies.mean()),
+            'agreement': float(np.mean([texts[path] == baseline[path] for path in texts])),
+        }
+        if ground_truth:
+            row['accuracy'] = float(np.mean([texts[path] == ground_truth[path] for path in ground_truth]))
+        report.append(row)
+
+    return report
+
+if __name__ == "__main__":
+    import argparse
+
+    current_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+    parser = argparse.ArgumentParser(description="Compare the inference backends against the torch baseline.")
+    parser.add_argument('--images', default=current_path + '/Data/Detection/images/val', help="Folder of test frames")
+    parser.add_argument('--labels', default=None, help="Folder of text labels for the exact match accuracy")
+    parser.add_argument('--count', type=int, default=200, help="Number of frames sampled from --images")
+    parser.add_argument('--models', default=current_path + '/Model')
+    parser.add_argument('--data', default=current_path + '/Data', help="Dataset folder for INT8 calibration")
+    parser.add_argument('--backends', nargs='+', default=[ONNX, OPENVINO], choices=BACKENDS)
+    parser.add_argument('--int8', action='store_true', help="Also compare the INT8 exports")
+    args = parser.parse_args()
+
+    configs = [(backend, False) for backend in args.backends]
+    if args.int8:
+        configs += [(backend, True) for backend in args.backends if backend != TORCH]
+
+    report = compare_backends(sample_images(args.images, args.count), args.models, configs,
+                              data_folder=args.data, label_folder=args.labels)
+
+    print(f"{'backend':<16}{'p50 ms':>10}{'p95 ms':>10}{'fps':>10}{'agree':>10}{'accuracy':>10}")
+    for row in report:
+        accuracy = f"{row['accuracy']:.3f}" if 'accuracy' in row else '-'
+        print(f"{row['backend']:<16}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['fps']:>10.1f}"
+              f"{row['agreement']:>10.3f}{accuracy:>10}")
@@ -0,0 +1,428 @@
+import csv
+import io
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .fuzzy import PlateMatchIndex
+from .metrics import metrics_registry
+
+# Channel notified by the parking_users trigger of App/init.sql
+CHANGE_CHANNEL = 'parking_users_changed'
+
+# Schema of the database, run by the db container on an empty volume and by apply_schema otherwise
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'App', 'init.sql')
+
+# Advisory lock serializing apply_schema between processes starting together
+SCHEMA_LOCK_ID = 177013
+
+def normalize_plate(plate):
+    """Normalizes a plate for lookups: upper case letters and digits only."""
+    return ''.join(ch for ch in str(plate).upper() if ch.isalnum())
+
+def apply_schema(conn, path=SCHEMA_PATH):
+    """
+    Brings an existing database up to date with App/init.sql.
+
+    The container only runs init.sql when its data volume is created, so databases created by an
+    older version miss the later tables, indexes and triggers. Every statement of the script is
+    idempotent: running it at startup creates what is missing and leaves the rest untouched.
+
+    Args:
+        conn: psycopg2 connection, committed by the caller
+        path (str): SQL script to run
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        script = file.read()
+
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+    cur.execute(script)
+    cur.close()
+
+def register_plate(conn, plate, user_name, msv):
+    """
+    Registers a plate, or updates its owner if it is already registered.
+
+    The id comes from the id_user sequence and the unique index on plate resolves concurrent
+    registrations of the same plate, so no lock or extra round trip is needed.
+
+    Args:
+        conn: psycopg2 connection, committed by the caller
+        plate (str): Plate, stored normalized
+        user_name (str): Owner name
+        msv (int): Owner student number
+
+    Returns:
+        id_user (int): Id of the registration
+    """
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO parking_users (plate, user_name, msv) VALUES (%s, %s, %s) "
+        "ON CONFLICT (plate) DO UPDATE SET user_name = EXCLUDED.user_name, msv = EXCLUDED.msv "
+        "RETURNING id_user",
+        (normalize_plate(plate), user_name, msv))
+    id_user = cur.fetchone()[0]
+    cur.close()
+    return id_user
+
+def read_registrations_csv(file):
+    """
+    Reads registrations from a CSV file with plate, user_name and msv columns.
+
+    Plates are normalized and, if a plate appears several times, its last row wins.
+
+    Args:
+        file: Path or text/binary file object
+
+    Returns:
+        rows (list): (plate, user_name, msv) tuples
+    """
+    # utf-8-sig drops the byte order mark Excel writes at the start of its CSV files
+    if isinstance(file, str):
+        with open(file, 'r', encoding='utf-8-sig', newline='') as text_file:
+            return read_registrations_csv(text_file)
+    if isinstance(file, io.BufferedIOBase):
+        # Binary uploads (e.g. Streamlit's file_uploader)
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+
+    registrations = {}
+    for row in csv.DictReader(file):
+        plate = normalize_plate(row['plate'])
+        if plate:
+            registrations[plate] = (plate, row['user_name'].strip(), int(row['msv']))
+    return list(registrations.values())
+
+def import_registrations(conn, rows, page_size=1000):
+    """
+    Upserts many registrations with multi-row INSERT statements.
+
+    Args:
+        conn: psycopg2 connection, committed by the caller
+        rows (list): (plate, user_name, msv) tuples with unique normalized plates
+        page_size (int): Rows per INSERT statement
+
+    Returns:
+        count (int): Number of rows sent
+    """
+    from psycopg2.extras import execute_values
+
+    cur = conn.cursor()
+    execute_values(
+        cur,
+        "INSERT INTO parking_users (plate, user_name, msv) VALUES %s "
+        "ON CONFLICT (plate) DO UPDATE SET user_name = EXCLUDED.user_name, msv = EXCLUDED.msv",
+        rows, page_size=page_size)
+    cur.close()
+    return len(rows)
+
+def fetch_users_page(conn, page=0, page_size=50):
+    """
+    Reads one page of parking_users, the most recent registrations first.
+
+    Returns:
+        rows (list): Rows of the page
+        columns (list): Column names
+        has_next (bool): Whether another page follows
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM parking_users ORDER BY id_user DESC LIMIT %s OFFSET %s",
+                (page_size + 1, page * page_size))
+    rows = cur.fetchall()
+    columns = [desc[0] for desc in cur.description]
+    cur.close()
+    return rows[:page_size], columns, len(rows) > page_size
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections shared by every session and thread of the app.
+
+    Callers wait (up to `timeout` seconds) for a free connection instead of opening a new one.
+
+    Args:
+        maxconn (int): Maximum number of open connections
+        minconn (int): Number of connections opened up front
+        timeout (float): Seconds to wait for a free connection before raising TimeoutError
+        **params: Connection parameters passed to psycopg2.connect
+    """
+
+    def __init__(self, maxconn=4, minconn=1, timeout=10.0, **params):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **params)
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("No database connection available in the pool")
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            # Broken connections are dropped, the pool opens a new one when needed
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection, commits on success and rolls back on error."""
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def close(self):
+        self._pool.closeall()
+
+class VerificationCache:
+    """
+    In-memory index of parking_users keyed by normalized plate.
+
+    The whole table is loaded once, then only the recent rows are fetched every `ttl` seconds. A
+    full reload happens every `full_refresh_every` refreshes, after `invalidate` or when an
+    UPDATE/DELETE is notified on the LISTEN channel. If the database is unreachable the last loaded
+    index keeps being served. The registered plates are also kept in a PlateMatchIndex so `match`
+    tolerates the look-alike characters the recognizer confuses.
+
+    Ids are taken from the sequence when a registration starts but the rows become visible when it
+    commits, so a lower id can show up after a higher one was read. Incremental refreshes therefore
+    read every id above the last one seen `overlap` seconds ago, not just above the last one seen.
+
+    Args:
+        connect (callable): Returns a DB-API connection (psycopg2, sqlite3, ...)
+        release (callable): Gives a connection back, closes it by default
+        ttl (float): Seconds between two refreshes
+        full_refresh_every (int): Number of incremental refreshes between two full reloads
+        placeholder (str): Parameter placeholder of the driver, '%s' for psycopg2 and '?' for sqlite3
+        overlap (float): Seconds the recent ids keep being read again, longer than `ttl` plus the
+            longest registration transaction
+    """
+
+    def __init__(self, connect, release=None, ttl=30.0, full_refresh_every=20, placeholder='%s', overlap=120.0):
+        self.connect = connect
+        self.release = release or (lambda conn: conn.close())
+        self.ttl = ttl
+        self.full_refresh_every = full_refresh_every
+        self.placeholder = placeholder
+        self.overlap = overlap
+
+        self.users = {}
+        self.plates = PlateMatchIndex()
+        self.last_id = 0
+        self.loaded_at = None
+        self.last_error = None
+
+        self._refreshes = 0
+        self._full_reload = True
+        self._listen_conn = None
+        self._watermarks = deque()  # (monotonic time the refresh started, last_id it had seen)
+        self._added = {}  # plate -> (user_name, msv, monotonic time) of the recent `add` calls
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _fetch(self, query, params=()):
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cur.close()
+            # Ends the read transaction so the connection can be reused as is
+            conn.commit()
+            return rows
+        finally:
+            self.release(conn)
+
+    def _reread_from(self, now):
+        """Returns the id the incremental refresh reads above: the last one seen `overlap` seconds ago."""
+        watermarks = self._watermarks
+        while len(watermarks) > 1 and now - watermarks[1][0] >= self.overlap:
+            watermarks.popleft()
+        if watermarks and now - watermarks[0][0] >= self.overlap:
+            return watermarks[0][1]
+        # Nothing is old enough yet (just started): everything is read again
+        return 0
+
+    def refresh(self, full=False):
+        """
+        Loads the recent rows of parking_users (or all of them if `full`).
+
+        Concurrent calls are serialized, each one sees the rows of the previous one.
+
+        Returns:
+            ok (bool): False if the database could not be reached, the old index is kept
+        """
+        with self._refresh_lock:
+            full = full or self._full_reload or self._refreshes >= self.full_refresh_every
+            start_time = time.monotonic()
+            since = self._reread_from(start_time)
+            try:
+                with metrics_registry.time('lp_db_query_seconds', errors='lp_db_errors_total',
+                                  operation='refresh_full' if full else 'refresh'):
+                    if full:
+                        rows = self._fetch("SELECT id_user, plate, user_name, msv FROM parking_users")
+                    else:
+                        rows = self._fetch(
+                            f"SELECT id_user, plate, user_name, msv FROM parking_users WHERE id_user > {self.placeholder}",
+                            (since,))
+            except Exception as e:
+                self.last_error = e
+                # Retry only after the next ttl instead of hammering a struggling database
+                self.loaded_at = time.monotonic()
+                return False
+
+            if full:
+                # A full reload rebuilds the fuzzy index so deleted plates disappear from it too
+                users = {normalize_plate(plate): (user_name, msv) for _, plate, user_name, msv in rows}
+                plates = PlateMatchIndex(users)
+
+            with self._lock:
+                # Merged under the lock so that the plates `add` registered meanwhile are kept
+                if not full:
+                    users = dict(self.users)
+                    for _, plate, user_name, msv in rows:
+                        plate = normalize_plate(plate)
+                        if plate not in users:
+                            self.plates.add(plate)
+                        users[plate] = (user_name, msv)
+                else:
+                    # Plates added after the query started may be missing from its rows
+                    for plate, (user_name, msv, added_at) in self._added.items():
+                        if added_at >= start_time:
+                            users[plate] = (user_name, msv)
+                            plates.add(plate)
+                    self.plates = plates
+                self._added = {plate: added for plate, added in self._added.items() if added[2] >= start_time}
+                self.users = users
+                self.last_id = max([0 if full else self.last_id] + [id_user for id_user, _, _, _ in rows])
+                self.loaded_at = time.monotonic()
+                self.last_error = None
+                self._refreshes = 0 if full else self._refreshes + 1
+                self._full_reload = False
+            self._watermarks.append((start_time, self.last_id))
+        return True
+
+    def invalidate(self):
+        """Forces a full reload on the next refresh."""
+        self._full_reload = True
+
+    def listen(self, conn, channel=CHANGE_CHANNEL):
+        """
+        Subscribes a dedicated psycopg2 connection to the change notifications of parking_users.
+
+        Inserts are picked up by the next incremental refresh, updates and deletes trigger a full one.
+        """
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"LISTEN {channel}")
+        cur.close()
+        self._listen_conn = conn
+
+    def _poll_notifications(self):
+        """Returns True if a change was notified since the last poll."""
+        if self._listen_conn is None:
+            return False
+
+        try:
+            self._listen_conn.poll()
+        except Exception as e:
+            self.last_error = e
+            return False
+
+        notifies = self._listen_conn.notifies
+        if not notifies:
+            return False
+
+        if any(notify.payload in ('UPDATE', 'DELETE', 'TRUNCATE') for notify in notifies):
+            self._full_reload = True
+        del notifies[:]
+        return True
+
+    @property
+    def stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= self.ttl
+
+    def refresh_if_stale(self):
+        if self._poll_notifications() or self.stale:
+            self.refresh()
+
+    def lookup(self, plate):
+        """
+        Returns the (user_name, msv) registered for a plate, or None.
+
+        Without a background refresher the index is refreshed here once its ttl expired.
+        """
+        if self._thread is None:
+            self.refresh_if_stale()
+        return self.users.get(normalize_plate(plate))
+
+    def match(self, plate, max_distance=1.0):
+        """
+        Returns the registered plates close to a recognized one, see plate_distance.
+
+        Args:
+            plate (str): Recognized plate
+            max_distance (float): Largest weighted edit distance accepted
+
+        Returns:
+            matches (list): (registered plate, distance, (user_name, msv)) tuples, nearest first
+        """
+        if self._thread is None:
+            self.refresh_if_stale()
+        with self._lock:
+            matches = self.plates.search(normalize_plate(plate), max_distance)
+            users = self.users
+        return [(candidate, distance, users[candidate]) for candidate, distance in matches if candidate in users]
+
+    def add(self, plate, user_name, msv):
+        """Adds a registration made by this process, once committed, without waiting for the next refresh."""
+        plate = normalize_plate(plate)
+        with self._lock:
+            users = dict(self.users)
+            users[plate] = (user_name, msv)
+            self.users = users
+            self.plates.add(plate)
+            self._added[plate] = (user_name, msv, time.monotonic())
+
+    def start(self, interval=1.0):
+        """Refreshes the index from a background thread so lookups never touch the database."""
+        if self._thread is not None:
+            return self
+
+        def run():
+            while not self._stop.wait(interval):
+                self.refresh_if_stale()
+
+        if self.loaded_at is None:
+            self.refresh()
+        self._thread = threading.Thread(target=run, name='verification-cache', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._listen_conn is not None:
+            self._listen_conn.close()
+            self._listen_conn = None
+
+    def __len__(self):
+        return len(self.users)
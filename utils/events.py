@@ -0,0 +1,191 @@
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from .metrics import metrics_registry
+
+# Columns of the access_events table written by AccessEventWriter
+EVENT_COLUMNS = ('plate', 'camera_id', 'track_id', 'seen_at', 'confidence', 'verified', 'crop_path')
+
+class AccessEventWriter:
+    """
+    Buffers access events in memory and writes them to access_events from a background thread.
+
+    `log` only appends to a bounded buffer, it never touches the database and never blocks the
+    recognition loop. The writer thread flushes a batch whenever `batch_size` events are waiting or
+    `flush_interval` seconds passed. When the database is slow or down, events accumulate up to
+    `max_pending`; past that new events are dropped and counted, and failed batches are retried
+    with an exponential backoff.
+
+    Args:
+        connect (callable): Returns a DB-API connection (psycopg2, sqlite3, ...)
+        release (callable): Gives a connection back, closes it by default
+        batch_size (int): Maximum number of events per INSERT
+        flush_interval (float): Maximum seconds an event waits before being flushed
+        max_pending (int): Maximum number of buffered events
+        placeholder (str): Parameter placeholder of the driver, '%s' for psycopg2 and '?' for sqlite3
+        max_backoff (float): Longest wait between two retries after a failed flush
+    """
+
+    def __init__(self, connect, release=None, batch_size=200, flush_interval=1.0, max_pending=10000,
+                 placeholder='%s', max_backoff=30.0):
+        self.connect = connect
+        self.release = release or (lambda conn: conn.close())
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.placeholder = placeholder
+        self.max_backoff = max_backoff
+
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self.last_error = None
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def log(self, plate, camera_id, confidence, verified, track_id=None, crop_path=None, seen_at=None):
+        """
+        Queues one event, returns False if the buffer is full and the event was dropped.
+        """
+        event = (plate, camera_id, track_id, seen_at or datetime.now(timezone.utc), float(confidence),
+                 bool(verified), crop_path)
+
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(event)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _take_batch(self):
+        with self._condition:
+            count = min(len(self._pending), self.batch_size)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _requeue(self, batch):
+        """Puts a failed batch back in front of the buffer, dropping what no longer fits."""
+        with self._condition:
+            room = max(0, self.max_pending - len(self._pending))
+            self.dropped += max(0, len(batch) - room)
+            self._pending.extendleft(reversed(batch[:room]))
+
+    def _insert(self, batch):
+        columns = ', '.join(EVENT_COLUMNS)
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            if type(conn).__module__.startswith('psycopg2'):
+                from psycopg2.extras import execute_values
+
+                # One multi-row INSERT instead of one round trip per event
+                execute_values(cur, f"INSERT INTO access_events ({columns}) VALUES %s", batch,
+                               page_size=self.batch_size)
+            else:
+                values = ', '.join([self.placeholder] * len(EVENT_COLUMNS))
+                cur.executemany(f"INSERT INTO access_events ({columns}) VALUES ({values})", batch)
+            cur.close()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def flush(self):
+        """
+        Writes every buffered event now.
+
+        Returns:
+            ok (bool): False if a batch could not be written, it is kept for the next flush
+        """
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return True
+            try:
+                with metrics_registry.time('lp_db_query_seconds', errors='lp_db_errors_total', operation='insert_events'):
+                    self._insert(batch)
+            except Exception as e:
+                self.last_error = e
+                self.failed_flushes += 1
+                self._requeue(batch)
+                return False
+            self.written += len(batch)
+
+    def _run(self):
+        backoff = self.flush_interval
+        while not self._stop.is_set():
+            with self._condition:
+                if len(self._pending) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+
+            if self.flush():
+                backoff = self.flush_interval
+            else:
+                # Leave a struggling database alone for a while, the events wait in the buffer
+                backoff = min(backoff * 2, self.max_backoff)
+                self._stop.wait(backoff)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='access-events', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        """Stops the writer thread, writing the remaining events first."""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if flush:
+            self.flush()
+
+class PlateEventLogger:
+    """
+    Turns the per-frame plate results of one camera into access events.
+
+    An event is logged when a track gets its first text or when its voted text changes, not on
+    every frame the plate is visible.
+
+    Args:
+        writer (AccessEventWriter): Where the events go
+        camera_id (str): Camera or video source the results come from
+        verify (callable): Returns whether a plate is registered, e.g. a VerificationCache lookup
+    """
+
+    def __init__(self, writer, camera_id, verify):
+        self.writer = writer
+        self.camera_id = camera_id
+        self.verify = verify
+        self._logged = {}
+
+    def __call__(self, plates):
+        for plate in plates:
+            text = plate['text']
+            if not text:
+                continue
+
+            key = plate['track_id'] if plate['track_id'] is not None else text
+            if self._logged.get(key) == text:
+                continue
+            self._logged[key] = text
+
+            self.writer.log(text, self.camera_id, plate['confidence'], self.verify(text),
+                            track_id=plate['track_id'])
+
+        # Forget old tracks so the memory stays bounded
+        if len(self._logged) > 1000:
+            self._logged = dict(list(self._logged.items())[-500:])
@@ -0,0 +1,118 @@
+# Characters the recognizer confuses with each other (see DECODE_PLATE)
+CONFUSION_GROUPS = ('0OD', '1I', '8B', '5S', '2Z')
+
+# Cost of substituting two characters of the same confusion group, any other edit costs 1
+CONFUSION_COST = 0.3
+
+# Representative character of the confusion group of every look-alike character
+CONFUSION_CLASS = {ch: group[0] for group in CONFUSION_GROUPS for ch in group}
+
+def confusion_key(plate):
+    """Maps every look-alike character to its group, plates differing only by look-alikes share a key."""
+    return ''.join(CONFUSION_CLASS.get(ch, ch) for ch in plate)
+
+def substitution_cost(a, b):
+    if a == b:
+        return 0.0
+    if a in CONFUSION_CLASS and CONFUSION_CLASS[a] == CONFUSION_CLASS.get(b):
+        return CONFUSION_COST
+    return 1.0
+
+def plate_distance(a, b, substitution=substitution_cost):
+    """
+    Weighted edit distance between two plates.
+
+    Insertions and deletions cost 1, substitutions between look-alike characters cost
+    CONFUSION_COST and other substitutions 1.
+
+    Args:
+        a, b (str): Plates
+        substitution (callable): Cost of substituting two characters
+    """
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i, ch_a in enumerate(a, 1):
+        current = [float(i)]
+        for j, ch_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + substitution(ch_a, ch_b)))
+        previous = current
+    return previous[-1]
+
+def edit_distance(a, b):
+    """Plain Levenshtein distance, every edit costs 1 (look-alike characters are errors too)."""
+    return int(plate_distance(a, b, lambda ch_a, ch_b: float(ch_a != ch_b)))
+
+def deletion_variants(key, max_edits):
+    """Returns the key and every string obtained by deleting up to `max_edits` of its characters."""
+    variants = {key}
+    frontier = {key}
+    for _ in range(max_edits):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+class PlateMatchIndex:
+    """
+    Index of registered plates returning the nearest ones within a weighted edit distance.
+
+    Look-alike substitutions disappear once plates are mapped to their confusion key, so a plate
+    within distance r of the query has a key within at most floor(r) plain edits of the query key.
+    Those keys are found with a symmetric deletion index: every key is stored under all its
+    variants with up to `max_edits` characters deleted, and a query only looks up the deletion
+    variants of its own key. Lookups cost a few dictionary hits whatever the number of plates, the
+    candidates are then checked with the exact weighted distance.
+
+    Args:
+        plates (iterable): Initial plates (normalized)
+        max_edits (int): Largest number of non look-alike edits a search can tolerate
+    """
+
+    def __init__(self, plates=(), max_edits=1):
+        self.max_edits = max_edits
+        self._by_variant = {}
+        self._plates = set()
+        for plate in plates:
+            self.add(plate)
+
+    def add(self, plate):
+        if plate in self._plates:
+            return
+        self._plates.add(plate)
+        for variant in deletion_variants(confusion_key(plate), self.max_edits):
+            self._by_variant.setdefault(variant, set()).add(plate)
+
+    def search(self, plate, max_distance=1.0):
+        """
+        Returns the registered plates within `max_distance` of a plate.
+
+        `max_distance` is capped to `max_edits` plus the look-alike substitutions that still fit.
+
+        Returns:
+            matches (list): (plate, distance) pairs, nearest first
+        """
+        edits = min(int(max_distance), self.max_edits)
+        candidates = set()
+        for variant in deletion_variants(confusion_key(plate), edits):
+            candidates |= self._by_variant.get(variant, set())
+
+        matches = []
+        for candidate in candidates:
+            distance = plate_distance(plate, candidate)
+            if distance <= max_distance:
+                matches.append((candidate, distance))
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def nearest(self, plate, max_distance=1.0):
+        """Returns the nearest (plate, distance) within `max_distance`, or None."""
+        matches = self.search(plate, max_distance)
+        return matches[0] if matches else None
+
+    def __len__(self):
+        return len(self._plates)
+
+    def __contains__(self, plate):
+        return plate in self._plates
@@ -0,0 +1,223 @@
+import bisect
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Default bucket upper bounds (seconds) of the latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Bucket upper bounds of the plates detected per frame
+DETECTION_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+
+# Metrics of the pipeline: name -> (type, help, histogram buckets)
+PIPELINE_METRICS = {
+    'lp_stage_seconds': ('histogram', "Latency of every pipeline stage", LATENCY_BUCKETS),
+    'lp_detections_per_frame': ('histogram', "Plates detected on a frame", DETECTION_BUCKETS),
+    'lp_recognizer_calls_total': ('counter', "Batched recognizer calls", None),
+    'lp_recognized_plates_total': ('counter', "Plate crops sent to the recognizer", None),
+    'lp_recognition_cache_total': ('counter', "Lookups of the recognition cache by result", None),
+    'lp_frames_read_total': ('counter', "Frames read from a video source", None),
+    'lp_frames_dropped_total': ('counter', "Frames dropped by a full pipeline buffer", None),
+    'lp_queue_depth': ('gauge', "Items waiting in a pipeline buffer", None),
+    'lp_db_query_seconds': ('histogram', "Latency of the database operations", LATENCY_BUCKETS),
+    'lp_db_errors_total': ('counter', "Failed database operations", None),
+}
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for key, value in labels)
+    return '{' + pairs + '}'
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms exported in the Prometheus text format.
+
+    The registry starts disabled: every recording method returns right away, so instrumented code
+    costs a function call when metrics are off. `serve` enables it and starts a local HTTP
+    endpoint. Values that are already counted elsewhere (buffer sizes, dropped frames) are not
+    recorded on the hot path but read at scrape time by collectors.
+
+    Args:
+        definitions (dict): name -> (type, help, buckets) of the known metrics
+    """
+
+    def __init__(self, definitions=PIPELINE_METRICS):
+        self.enabled = False
+        self.definitions = dict(definitions)
+        self.values = {}
+        self.histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def define(self, name, kind, help_text, buckets=None):
+        self.definitions[name] = (kind, help_text, buckets)
+
+    def inc(self, name, value=1, **labels):
+        """Adds to a counter."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Sets a gauge."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        """Adds a sample to a histogram."""
+        if not self.enabled:
+            return
+        buckets = self.definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # One count per bucket plus +Inf, then the sum of the samples
+                histogram = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+
+    @contextmanager
+    def time(self, name, errors=None, **labels):
+        """Observes the duration of the block, and counts it in `errors` if it raises."""
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if errors is not None:
+                self.inc(errors, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def observe_stage(self, stage, seconds):
+        """StageTimer listener, see StageTimer.add_listener."""
+        self.observe('lp_stage_seconds', seconds, stage=stage)
+
+    def add_collector(self, collector):
+        """
+        Registers a callable returning (name, labels dict, value) samples, called at every scrape.
+
+        Collectors returning None are removed, e.g. when the object they read is gone.
+        """
+        if self.enabled:
+            with self._lock:
+                self._collectors.append(collector)
+
+    def _collect(self):
+        values = {}
+        dead = []
+        for collector in list(self._collectors):
+            samples = collector()
+            if samples is None:
+                dead.append(collector)
+                continue
+            for name, labels, value in samples:
+                key = (name, tuple(sorted(labels.items())))
+                values[key] = values.get(key, 0) + value
+        if dead:
+            with self._lock:
+                self._collectors = [collector for collector in self._collectors if collector not in dead]
+        return values
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        collected = self._collect()
+        with self._lock:
+            values = dict(self.values)
+            histograms = {key: list(histogram) for key, histogram in self.histograms.items()}
+        values.update(collected)
+
+        lines = []
+        for name, (kind, help_text, buckets) in self.definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (metric, labels), histogram in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ['+Inf'], histogram[:-1]):
+                        cumulative += count
+                        le = bound if bound == '+Inf' else _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram[-1])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+            else:
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """Enables the registry and serves GET /metrics from a background thread."""
+        if self._server is not None:
+            return self
+        self.enabled = True
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.enabled = False
+
+# Registry the pipeline reports to, disabled until serve() is called
+metrics_registry = MetricsRegistry()
+
+def pipeline_collector(name, pipeline):
+    """
+    Collector of a FramePipeline: frames read, frames dropped by each buffer and queue depths.
+
+    The pipeline is only weakly referenced, the collector goes away with it.
+    """
+    ref = weakref.ref(pipeline)
+
+    def collect():
+        pipeline = ref()
+        if pipeline is None:
+            return None
+        return [
+            ('lp_frames_read_total', {'source': name}, pipeline.frames_read),
+            ('lp_frames_dropped_total', {'source': name, 'buffer': 'capture'}, pipeline.frames.dropped),
+            ('lp_frames_dropped_total', {'source': name, 'buffer': 'result'}, pipeline.results.dropped),
+            ('lp_queue_depth', {'source': name, 'buffer': 'capture'}, len(pipeline.frames)),
+            ('lp_queue_depth', {'source': name, 'buffer': 'result'}, len(pipeline.results)),
+        ]
+
+    return collect
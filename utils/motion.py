@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+class MotionGate:
+    """
+    Cheap pre-filter deciding whether a frame is worth running the detector on.
+
+    The frame (or its region of interest) is converted to grayscale, downscaled and blurred, then
+    compared with a rolling background. The detector runs when enough pixels changed, for
+    `hold_frames` frames after the last change (a car stopping at the barrier no longer moves but
+    its plate still needs a few reads), and at least every `refresh_interval` frames. Skipped
+    frames reuse `plates`, the result of the last detected frame.
+
+    Args:
+        roi (tuple): Region of interest (x1, y1, x2, y2) as fractions of the frame size, None for the whole frame
+        width (int): Width the region is downscaled to before comparing
+        pixel_threshold (int): Gray level difference above which a pixel counts as changed
+        change_threshold (float): Fraction of changed pixels above which the scene changed
+        background_rate (float): Weight of the new frame in the rolling background, 1 compares
+            with the previous frame only
+        hold_frames (int): Frames still detected after the last change
+        refresh_interval (int): Maximum number of frames skipped in a row
+    """
+
+    def __init__(self, roi=None, width=160, pixel_threshold=25, change_threshold=0.01, background_rate=0.05,
+                 hold_frames=5, refresh_interval=30):
+        self.roi = roi
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.change_threshold = change_threshold
+        self.background_rate = background_rate
+        self.hold_frames = hold_frames
+        self.refresh_interval = refresh_interval
+
+        self.frames = 0
+        self.skipped = 0
+        self.plates = []
+        self.last_change = 0.0
+        self._background = None
+        self._since_change = None
+        self._since_detect = 0
+
+    def _prepare(self, frame):
+        if self.roi is not None:
+            height, width = frame.shape[:2]
+            x1, y1, x2, y2 = self.roi
+            frame = frame[int(y1 * height):int(y2 * height), int(x1 * width):int(x2 * width)]
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        height = max(1, int(round(gray.shape[0] * self.width / max(gray.shape[1], 1))))
+        small = cv2.resize(gray, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+    def check(self, frame):
+        """Returns True if the detector should run on this frame."""
+        self.frames += 1
+        small = self._prepare(frame)
+
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small
+            changed = True
+        else:
+            diff = cv2.absdiff(small, self._background)
+            self.last_change = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+            changed = self.last_change >= self.change_threshold
+            cv2.accumulateWeighted(small, self._background, self.background_rate)
+
+        if changed:
+            self._since_change = 0
+        elif self._since_change is not None:
+            self._since_change += 1
+
+        run = (self._since_change is not None and self._since_change <= self.hold_frames) \
+            or self._since_detect >= self.refresh_interval
+        if run:
+            self._since_detect = 0
+        else:
+            self._since_detect += 1
+            self.skipped += 1
+        return run
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def reset(self):
+        self.plates = []
+        self._background = None
+        self._since_change = None
+        self._since_detect = 0
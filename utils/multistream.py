@@ -0,0 +1,224 @@
+import threading
+import time
+
+import cv2
+
+from .utils import PlateTracker, draw_plates, recognize_plates_batch
+from .stream import DROP_OLDEST, FrameBuffer
+from .profiling import pipeline_timer
+
+class CameraStream:
+    """
+    One source of a MultiStreamRunner: a capture thread and the buffers of the stream.
+
+    Live cameras keep only their newest frame, so a slow batch never makes a gate lag behind.
+    Video files block the capture instead so that no frame is lost.
+
+    Args:
+        stream_id (str): Name the results of the stream are routed under
+        source: Camera URL, video path or device index passed to cv2.VideoCapture
+        capture_size (int): Size of the buffer between capture and the scheduler
+        capture_policy (str): Policy of that buffer, DROP_OLDEST by default or BLOCK for files
+        result_size (int): Size of the buffer of processed frames waiting to be read
+        sampler (FrameSampler): Frame skipping of video files, None reads every frame
+        track (bool): Smooth the boxes and vote the texts with a PlateTracker of the stream
+    """
+
+    def __init__(self, stream_id, source, capture_size=1, capture_policy=DROP_OLDEST, result_size=1,
+                 sampler=None, track=True):
+        self.stream_id = stream_id
+        self.source = source
+        self.sampler = sampler
+        self.tracker = PlateTracker() if track else None
+        self.frames = FrameBuffer(capture_size, capture_policy)
+        self.results = FrameBuffer(result_size, DROP_OLDEST)
+        self.processed = 0
+        self.error = None
+
+        self._cap = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, on_frame):
+        """Opens the source and starts capturing, `on_frame` is called after every buffered frame."""
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            raise IOError(f"Cannot open video source: {self.source}")
+        if self.sampler is not None:
+            self.sampler.attach(self._cap)
+
+        self._thread = threading.Thread(target=self._capture_loop, args=(on_frame,),
+                                        name=f'capture-{self.stream_id}', daemon=True)
+        self._thread.start()
+        return self
+
+    def _capture_loop(self, on_frame):
+        try:
+            while not self._stop.is_set():
+                if self.sampler is not None:
+                    ret, frame = self.sampler.read(self._cap)
+                else:
+                    ret, frame = self._cap.read()
+                if not ret or frame is None:
+                    break
+                self.frames.put(frame)
+                on_frame()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.frames.close()
+            on_frame()
+
+    @property
+    def exhausted(self):
+        return self.frames.closed and len(self.frames) == 0
+
+    def stop(self):
+        self._stop.set()
+        self.frames.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        if self._cap is not None:
+            self._cap.release()
+
+class MultiStreamRunner:
+    """
+    Runs several cameras or videos on one shared detector and recognizer.
+
+    Every stream captures into its own buffer. A single scheduler thread takes at most one frame
+    from each stream with a frame waiting and runs them as one batch: one detector call for all
+    frames and one recognizer call for all their plates. A batch starts as soon as `max_batch`
+    frames are collected or `max_wait` seconds after the first one arrived, so a lone camera is
+    never held back long while many cameras share the model calls. The results are routed back
+    to the buffer (and callback) of the stream the frame came from.
+
+    Args:
+        detector: License plate detection YOLO model, shared by every stream
+        recognizer: Character recognition YOLO model, shared by every stream
+        max_batch (int): Maximum number of frames per batch
+        max_wait (float): Maximum seconds the first frame of a batch waits for more frames
+        annotate (bool): Draw the plates on the processed frames
+        on_result (callable): Called with (stream_id, frame, plates) from the scheduler thread
+        timer (StageTimer): Records the stages of every batch
+        recognition_cache (RecognitionCache): Optional cache of the plates read, shared by the streams
+    """
+
+    def __init__(self, detector, recognizer, max_batch=8, max_wait=0.02, annotate=True, on_result=None,
+                 timer=pipeline_timer, recognition_cache=None):
+        self.detector = detector
+        self.recognizer = recognizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.annotate = annotate
+        self.on_result = on_result
+        self.timer = timer
+        self.recognition_cache = recognition_cache
+
+        self.streams = {}
+        self.batches = 0
+        self.error = None
+
+        self._next = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_stream(self, stream_id, source, **kwargs):
+        """Adds a source before `start`, see CameraStream for the arguments."""
+        if stream_id in self.streams:
+            raise ValueError(f"Duplicate stream id: {stream_id}")
+        self.streams[stream_id] = CameraStream(stream_id, source, **kwargs)
+        return self.streams[stream_id]
+
+    def _notify(self):
+        with self._condition:
+            self._condition.notify()
+
+    def start(self):
+        for stream in self.streams.values():
+            stream.start(self._notify)
+        self._thread = threading.Thread(target=self._schedule_loop, name='batch-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def _ready(self):
+        return [stream for stream in self.streams.values() if len(stream.frames) > 0]
+
+    def _collect(self):
+        """Waits for the next batch, returns a list of (stream, frame), empty when every stream ended."""
+        with self._condition:
+            while not self._ready():
+                if self._stop.is_set() or all(stream.exhausted for stream in self.streams.values()):
+                    return []
+                self._condition.wait(0.1)
+
+            # Give the other streams up to max_wait to join the batch
+            deadline = time.monotonic() + self.max_wait
+            live = sum(not stream.exhausted for stream in self.streams.values())
+            while len(self._ready()) < min(self.max_batch, live) and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+        # Round robin over the streams so that none starves when there are more than max_batch
+        streams = list(self.streams.values())
+        streams = streams[self._next:] + streams[:self._next]
+        self._next = (self._next + 1) % len(streams)
+
+        batch = []
+        for stream in streams:
+            if len(batch) >= self.max_batch:
+                break
+            frame = stream.frames.get(timeout=0)
+            if frame is not None:
+                batch.append((stream, frame))
+        return batch
+
+    def _schedule_loop(self):
+        try:
+            while not self._stop.is_set():
+                batch = self._collect()
+                if not batch:
+                    break
+
+                start_time = time.perf_counter()
+                frames = [frame for _, frame in batch]
+                results = recognize_plates_batch(frames, self.detector, self.recognizer,
+                                                 [stream.tracker for stream, _ in batch], self.timer,
+                                                 recognition_cache=self.recognition_cache)
+                latency = time.perf_counter() - start_time
+                self.timer.record('batch', latency)
+                self.batches += 1
+
+                for (stream, frame), plates in zip(batch, results):
+                    if self.annotate:
+                        draw_plates(frame, plates)
+                    if stream.sampler is not None:
+                        stream.sampler.update(latency)
+                    stream.processed += 1
+                    stream.results.put((frame, plates))
+                    if self.on_result is not None:
+                        self.on_result(stream.stream_id, frame, plates)
+        except Exception as e:
+            self.error = e
+        finally:
+            for stream in self.streams.values():
+                stream.results.close()
+
+    def read(self, stream_id, timeout=None):
+        """Returns the next (frame, plates) of a stream, None once it ended or the timeout expired."""
+        return self.streams[stream_id].results.get(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+        for stream in self.streams.values():
+            stream.stop()
+        self._notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,222 @@
+import os
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+from .utils import index_folder, read_label
+
+# Files of a packed dataset folder
+IMAGES_FILE = 'images.bin'          # uint8 pixels (or encoded JPEG/PNG bytes) of every image, back to back
+IMAGE_INDEX_FILE = 'image_index.npy'  # (N, 5) int64: offset, size, height, width, channels
+NAMES_FILE = 'names.npy'            # (N,) image names without extension
+BOXES_FILE = 'boxes.npy'            # (M, 4) float32 YOLO boxes: x_center, y_center, width, height
+CLASSES_FILE = 'classes.npy'        # (M,) int16 class ids
+BOX_OFFSETS_FILE = 'box_offsets.npy'  # (N + 1,) int64, the boxes of image i are [offsets[i], offsets[i + 1])
+TEXTS_FILE = 'texts.npy'            # (N,) plate texts, only with text labels
+META_FILE = 'meta.json'
+
+def parse_yolo_labels(label_path):
+    """
+    Reads a YOLO label file into columnar arrays.
+
+    Returns:
+        classes (np.ndarray): (K,) class ids
+        boxes (np.ndarray): (K, 4) x_center, y_center, width, height
+    """
+    with open(label_path, 'r') as file:
+        values = np.array(file.read().split(), dtype=np.float32).reshape(-1, 5)
+    return values[:, 0].astype(np.int16), values[:, 1:]
+
+def build_packed_dataset(image_folder, label_folder, output_folder, text_label_folder=None, encoded=False, workers=8):
+    """
+    Packs a folder of images and YOLO labels into a single memory-mappable dataset.
+
+    Args:
+        image_folder (str): Folder of .jpg/.png images
+        label_folder (str): Folder of YOLO labels with the same names as the images
+        output_folder (str): Folder the packed dataset is written to
+        text_label_folder (str): Optional folder of plate text labels (same names, .txt)
+        encoded (bool): Store the encoded image files instead of decoded BGR pixels, much smaller
+            for full frames but the reader has to decode them
+        workers (int): Threads decoding the images, at most `4 * workers` decoded images wait to be written
+
+    Returns:
+        count (int): Number of packed images
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    image_index = index_folder(image_folder, ('.jpg', '.png'))
+    label_index = index_folder(label_folder, ('.txt',))
+    text_index = index_folder(text_label_folder, ('.txt',)) if text_label_folder else {}
+    names = sorted(name for name in image_index if name in label_index)
+
+    def load(name):
+        path = image_index[name][0]
+        if encoded:
+            with open(path, 'rb') as file:
+                return np.frombuffer(file.read(), dtype=np.uint8), (0, 0, 0)
+        image = cv2.imread(path)
+        if image is None:
+            return None, None
+        image = image.reshape(image.shape[0], image.shape[1], -1)
+        return image, image.shape
+
+    def decoded(executor):
+        # Only a window of images is submitted ahead of the writer, so memory does not grow with the dataset
+        in_flight = deque()
+        for name in names:
+            in_flight.append((name, executor.submit(load, name)))
+            if len(in_flight) > 4 * workers:
+                name, future = in_flight.popleft()
+                yield name, future.result()
+        for name, future in in_flight:
+            yield name, future.result()
+
+    kept_names, index, box_offsets, all_boxes, all_classes, texts = [], [], [0], [], [], []
+    offset = 0
+
+    # Images are decoded in parallel and appended to the data file in order
+    with open(os.path.join(output_folder, IMAGES_FILE), 'wb') as data_file, ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, (data, shape) in decoded(executor):
+            if data is None:
+                continue
+
+            data_file.write(np.ascontiguousarray(data).tobytes())
+            index.append((offset, data.nbytes) + tuple(shape))
+            offset += data.nbytes
+
+            classes, boxes = parse_yolo_labels(label_index[name][0])
+            all_classes.append(classes)
+            all_boxes.append(boxes)
+            box_offsets.append(box_offsets[-1] + len(boxes))
+
+            kept_names.append(name)
+            if text_label_folder:
+                texts.append(read_label(text_index[name][0]) if name in text_index else '')
+
+    np.save(os.path.join(output_folder, IMAGE_INDEX_FILE), np.array(index, dtype=np.int64).reshape(-1, 5))
+    np.save(os.path.join(output_folder, NAMES_FILE), np.array(kept_names, dtype=str))
+    np.save(os.path.join(output_folder, BOXES_FILE),
+            np.concatenate(all_boxes) if all_boxes else np.zeros((0, 4), dtype=np.float32))
+    np.save(os.path.join(output_folder, CLASSES_FILE),
+            np.concatenate(all_classes) if all_classes else np.zeros(0, dtype=np.int16))
+    np.save(os.path.join(output_folder, BOX_OFFSETS_FILE), np.array(box_offsets, dtype=np.int64))
+    if text_label_folder:
+        np.save(os.path.join(output_folder, TEXTS_FILE), np.array(texts, dtype=str))
+
+    with open(os.path.join(output_folder, META_FILE), 'w') as file:
+        json.dump({'count': len(kept_names), 'encoded': encoded, 'color': 'BGR'}, file)
+
+    return len(kept_names)
+
+def build_packed_splits(dataset_folder, output_folder, splits=('train', 'val'), encoded=False, workers=8,
+                        text_labels='tex_label'):
+    """
+    Packs a dataset laid out like Data/Detection and Data/OCR (images/<split>, labels/<split>).
+
+    The plate texts are packed too when the dataset has a <text_labels>/<split> folder of text labels.
+
+    Returns:
+        counts (dict): split -> number of packed images
+    """
+    counts = {}
+    for split in splits:
+        image_folder = os.path.join(dataset_folder, 'images', split)
+        if not os.path.isdir(image_folder):
+            continue
+        text_label_folder = os.path.join(dataset_folder, text_labels, split) if text_labels else None
+        if text_label_folder and not os.path.isdir(text_label_folder):
+            text_label_folder = None
+        counts[split] = build_packed_dataset(image_folder, os.path.join(dataset_folder, 'labels', split),
+                                             os.path.join(output_folder, split), text_label_folder=text_label_folder,
+                                             encoded=encoded, workers=workers)
+    return counts
+
+class PackedDataset:
+    """
+    Zero-copy reader of a packed dataset.
+
+    The image data is memory-mapped and every accessor returns views into it, so loading the
+    whole dataset is a handful of opens and pages are only read when they are used.
+
+    Args:
+        folder (str): Folder written by build_packed_dataset
+    """
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, META_FILE), 'r') as file:
+            self.meta = json.load(file)
+
+        data_path = os.path.join(folder, IMAGES_FILE)
+        if os.path.getsize(data_path) > 0:
+            self.data = np.memmap(data_path, dtype=np.uint8, mode='r')
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+        self.index = np.load(os.path.join(folder, IMAGE_INDEX_FILE), mmap_mode='r')
+        self.names = np.load(os.path.join(folder, NAMES_FILE))
+        self.all_boxes = np.load(os.path.join(folder, BOXES_FILE), mmap_mode='r')
+        self.all_classes = np.load(os.path.join(folder, CLASSES_FILE), mmap_mode='r')
+        self.box_offsets = np.load(os.path.join(folder, BOX_OFFSETS_FILE), mmap_mode='r')
+
+        texts_path = os.path.join(folder, TEXTS_FILE)
+        self.texts = np.load(texts_path) if os.path.exists(texts_path) else None
+
+    @property
+    def encoded(self):
+        return self.meta['encoded']
+
+    def __len__(self):
+        return len(self.index)
+
+    def image_bytes(self, i):
+        """Raw stored bytes of image i, a view into the memory map."""
+        offset, size = self.index[i, :2]
+        return self.data[offset:offset + size]
+
+    def image(self, i):
+        """
+        Image i as an (H, W, C) BGR array.
+
+        Decoded datasets return a read-only view into the memory map, encoded ones decode the image.
+        """
+        if self.encoded:
+            return cv2.imdecode(self.image_bytes(i), cv2.IMREAD_COLOR)
+        height, width, channels = self.index[i, 2:]
+        return self.image_bytes(i).reshape(height, width, channels)
+
+    def boxes(self, i):
+        """YOLO boxes (x_center, y_center, width, height) of image i, a view."""
+        return self.all_boxes[self.box_offsets[i]:self.box_offsets[i + 1]]
+
+    def classes(self, i):
+        """Class ids of the boxes of image i, a view."""
+        return self.all_classes[self.box_offsets[i]:self.box_offsets[i + 1]]
+
+    def text(self, i):
+        """Plate text of image i, None if the dataset was packed without text labels."""
+        return None if self.texts is None else str(self.texts[i])
+
+    def __getitem__(self, i):
+        return self.image(i), self.boxes(i), self.classes(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack a YOLO dataset (images/<split>, labels/<split>) into memory-mappable shards.")
+    parser.add_argument('dataset', help="Dataset folder, e.g. Data/OCR")
+    parser.add_argument('output', help="Output folder, one packed dataset per split")
+    parser.add_argument('--encoded', action='store_true', help="Keep the encoded files instead of decoded pixels")
+    parser.add_argument('--text-labels', default='tex_label', help="Folder of the plate text labels (<text-labels>/<split>)")
+    args = parser.parse_args()
+
+    counts = build_packed_splits(args.dataset, args.output, encoded=args.encoded, text_labels=args.text_labels)
+    for split, count in counts.items():
+        print(f"{split}: packed {count} images")
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Stages of the recognition pipeline, in execution order
+PIPELINE_STAGES = ('gate', 'detect', 'crop', 'cache', 'recognize', 'decode', 'annotate', 'frame', 'preview', 'verify')
+
+# Bucket edges (seconds) of the latency histograms, from 0.1ms to 10s
+HISTOGRAM_BUCKETS = np.logspace(-4, 1, 26)
+
+class StageTimer:
+    """
+    Per-stage latency recorder with rolling windows.
+
+    Every stage keeps its last `window` durations, from which percentiles, histograms and the frame
+    rate are computed. The recorder is thread-safe so the capture, inference and display threads can
+    share it.
+
+    Args:
+        window (int): Number of recent samples kept per stage
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block as one sample of `name`."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start_time)
+
+    def record(self, name, seconds):
+        with self._lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+                self.counts[name] = 0
+            self.samples[name].append(seconds)
+            self.counts[name] += 1
+        for listener in self._listeners:
+            listener(name, seconds)
+
+    def add_listener(self, listener):
+        """Calls `listener(stage, seconds)` for every recorded sample, e.g. to export metrics."""
+        self._listeners.append(listener)
+
+    def _values(self, name):
+        with self._lock:
+            return np.array(self.samples.get(name, ()), dtype=np.float64)
+
+    def percentiles(self, name, q=(50, 95, 99)):
+        """Returns the percentiles (seconds) of the recent samples of a stage, None if there are none."""
+        values = self._values(name)
+        if len(values) == 0:
+            return None
+        return np.percentile(values, q)
+
+    def histogram(self, name, buckets=HISTOGRAM_BUCKETS):
+        """Returns the number of recent samples of a stage falling in each bucket."""
+        return np.histogram(self._values(name), bins=buckets)[0]
+
+    def fps(self, name='frame'):
+        """Frame rate derived from the mean duration of the recent samples of a stage."""
+        values = self._values(name)
+        if len(values) == 0:
+            return 0.0
+        return 1 / max(values.mean(), 1e-6)
+
+    def summary(self):
+        """
+        Returns the statistics of every stage.
+
+        Returns:
+            summary (dict): stage -> {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'}
+        """
+        summary = {}
+        for name in list(self.samples):
+            values = self._values(name) * 1000
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            summary[name] = {
+                'count': self.counts[name],
+                'mean_ms': float(values.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+            }
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+            self.counts = {}
+
+# Timer used by process_frame unless another one is given
+pipeline_timer = StageTimer()
+
+def compare_summaries(baseline, current, threshold=0.1, metric='p50_ms'):
+    """
+    Compares two StageTimer summaries.
+
+    Args:
+        baseline (dict): Summary of the reference run
+        current (dict): Summary of the new run
+        threshold (float): Relative slowdown above which a stage is reported as a regression
+        metric (str): Statistic compared
+
+    Returns:
+        rows (list): (stage, baseline value, current value, relative change, regressed) per common stage
+    """
+    rows = []
+    for name in baseline:
+        if name not in current:
+            continue
+        before, after = baseline[name][metric], current[name][metric]
+        change = (after - before) / before if before > 0 else 0.0
+        rows.append((name, before, after, change, change > threshold))
+    return rows
@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .metrics import metrics_registry
+
+def plate_hash(crop, hash_size=(48, 16), edge_threshold=4):
+    """
+    Difference hash (dHash) of a plate crop.
+
+    The crop is normalized to grayscale and a fixed size, then every bit tells whether a pixel is
+    brighter than its left neighbour by more than `edge_threshold` gray levels. The threshold keeps
+    the flat background of the plate at 0 instead of flipping with sensor noise. The hash only
+    narrows down the candidates: plates differing by one confusable character (O and Q, 0 and D,
+    5 and 6) can hash within a few bits of each other, or to the same bits.
+
+    Args:
+        crop (np.ndarray): BGR or grayscale plate crop
+        hash_size (tuple): (columns, rows) of the hash, columns * rows bits
+        edge_threshold (int): Gray level difference below which neighbours count as equal
+
+    Returns:
+        hash (int): The bits of the hash
+    """
+    columns, rows = hash_size
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(gray, (columns + 1, rows), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = ((small[:, 1:] - small[:, :-1]) > edge_threshold).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def plate_thumbnail(crop, thumbnail_size=(64, 16)):
+    """Grayscale copy of a plate crop at a fixed size, normalized to zero mean and unit variance."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(gray, thumbnail_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    return (small - small.mean()) / (small.std() + 1e-6)
+
+def thumbnail_difference(thumbnail, other, block=4):
+    """
+    Largest mean absolute difference between two thumbnails over a `block` x `block` window.
+
+    Noise averages out over a window while a character that differs (the tail of a Q, the left
+    side of a D) stays concentrated in one, so a single different character is not diluted by
+    the rest of the plate.
+    """
+    return float(cv2.blur(np.abs(thumbnail - other), (block, block)).max())
+
+class RecognitionCache:
+    """
+    Bounded LRU cache of recognized plates keyed by the perceptual hash of their crop.
+
+    A cached plate is a candidate when its hash is within `max_distance` differing bits. The hashes
+    are split into `max_distance + 1` bands indexed separately: two hashes within `max_distance`
+    bits share at least one identical band, so a lookup only compares the few entries of its own
+    bands. As different plates can share a hash, a candidate only hits if the thumbnail stored with
+    it also matches the crop within `max_difference`. Entries expire `ttl` seconds after they were
+    stored. The cache is thread-safe and can be shared by every stream of the process.
+
+    A hit skips the recognizer, and a wrong hit verifies a car as another plate. The default only
+    accepts identical hashes; measure the distances on real footage before raising `max_distance`.
+    Crops that miss (shifted, rescaled) are simply recognized again.
+
+    Args:
+        max_size (int): Maximum number of cached plates, the least recently used go first
+        ttl (float): Seconds a recognized plate stays valid
+        max_distance (int): Largest Hamming distance between the hashes of a crop and a cached plate
+        hash_size (tuple): (columns, rows) of the hashes, see plate_hash
+        min_confidence (float): Reads below this confidence are not cached
+        max_difference (float): Largest thumbnail difference of a hit, see thumbnail_difference
+        thumbnail_size (tuple): (width, height) of the thumbnails, see plate_thumbnail
+    """
+
+    def __init__(self, max_size=512, ttl=60.0, max_distance=0, hash_size=(48, 16), min_confidence=0.5,
+                 max_difference=0.2, thumbnail_size=(64, 16)):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.min_confidence = min_confidence
+        self.max_difference = max_difference
+        self.thumbnail_size = thumbnail_size
+
+        self.hits = 0
+        self.misses = 0
+
+        bits = hash_size[0] * hash_size[1]
+        self._packed_bits = (bits + 7) // 8 * 8  # plate_hash pads the bits to whole bytes
+        band_count = max_distance + 1
+        self._bands = [(bits * i // band_count, bits * (i + 1) // band_count) for i in range(band_count)]
+        self._entries = OrderedDict()  # hash -> (text, confidence, stored_at, thumbnail)
+        self._index = [{} for _ in self._bands]  # band value -> set of hashes
+        self._lock = threading.Lock()
+
+    def _band_values(self, key):
+        return [(key >> (self._packed_bits - end)) & ((1 << (end - start)) - 1) for start, end in self._bands]
+
+    def _remove(self, key):
+        del self._entries[key]
+        for index, value in zip(self._index, self._band_values(key)):
+            keys = index[value]
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def _find(self, key, thumbnail):
+        candidates = set()
+        for index, value in zip(self._index, self._band_values(key)):
+            candidates |= index.get(value, set())
+
+        # Expired entries are dropped first, so that they cannot hide a valid one
+        now = time.monotonic()
+        best, best_score = None, None
+        for candidate in candidates:
+            stored_at, stored_thumbnail = self._entries[candidate][2:]
+            if now - stored_at > self.ttl:
+                self._remove(candidate)
+                continue
+            distance = (candidate ^ key).bit_count()
+            if distance > self.max_distance:
+                continue
+            difference = thumbnail_difference(thumbnail, stored_thumbnail)
+            if difference <= self.max_difference and (best is None or (distance, difference) < best_score):
+                best, best_score = candidate, (distance, difference)
+        return best
+
+    def signature(self, crop):
+        """Returns the (hash, thumbnail) a crop is looked up and stored with."""
+        return plate_hash(crop, self.hash_size), plate_thumbnail(crop, self.thumbnail_size)
+
+    def get(self, signature):
+        """Returns the (text, confidence) cached for a plate signature, or None."""
+        with self._lock:
+            found = self._find(*signature)
+            if found is None:
+                self.misses += 1
+                metrics_registry.inc('lp_recognition_cache_total', result='miss')
+                return None
+
+            self._entries.move_to_end(found)
+            self.hits += 1
+            metrics_registry.inc('lp_recognition_cache_total', result='hit')
+            text, confidence = self._entries[found][:2]
+            return text, confidence
+
+    def put(self, signature, text, confidence):
+        if not text or confidence < self.min_confidence:
+            return
+        key, thumbnail = signature
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (text, confidence, time.monotonic(), thumbnail)
+            for index, value in zip(self._index, self._band_values(key)):
+                index.setdefault(value, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index = [{} for _ in self._bands]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,261 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+# Policies applied when a bounded buffer is full
+DROP_OLDEST = 'drop_oldest'  # Discard the oldest item to make room for the new one (live streams)
+DROP_NEWEST = 'drop_newest'  # Discard the incoming item and keep the buffered ones
+BLOCK = 'block'              # Wait until the consumer makes room (video files, no frame is lost)
+
+# Ways of skipping the frames that are not sampled
+GRAB = 'grab'  # cap.grab() the skipped frames, they are demuxed but never retrieved/color converted
+SEEK = 'seek'  # Jump over the skipped frames with CAP_PROP_POS_FRAMES (video files only)
+
+class FrameBuffer:
+    """
+    Bounded, thread-safe buffer between two pipeline stages.
+
+    Args:
+        maxsize (int): Maximum number of buffered items, 1 keeps only the newest frame
+        policy (str): What to do when the buffer is full: DROP_OLDEST, DROP_NEWEST or BLOCK
+    """
+
+    def __init__(self, maxsize=1, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f"Unknown buffer policy: {policy}")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._items = deque()
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, item):
+        """Adds an item to the buffer, returns False if an item had to be dropped."""
+        with self._condition:
+            if self.policy == BLOCK:
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._condition.wait()
+
+            if self._closed:
+                return False
+
+            accepted = True
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return False
+                self._items.popleft()
+                accepted = False
+
+            self._items.append(item)
+            self._condition.notify_all()
+            return accepted
+
+    def get(self, timeout=None):
+        """Returns the next item, or None if the buffer is closed and empty or the timeout expired."""
+        with self._condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+            if not self._items:
+                return None
+
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def close(self):
+        """Wakes up every waiting producer and consumer, no item is accepted afterwards."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        return len(self._items)
+
+class FrameSampler:
+    """
+    Decides which frames of a video source are decoded and sent to inference.
+
+    Skipped frames are only grabbed (or seeked over), so they never pay for a full decode and color
+    conversion. With a `target_fps` the skip interval adapts to the measured processing latency: at
+    most `target_fps` frames per second of video are sampled, and never more than inference can keep
+    up with in real time.
+
+    Args:
+        skip_frames (int): Initial number of frames skipped between two sampled frames
+        target_fps (float): Wanted inference rate, None keeps `skip_frames` fixed
+        mode (str): GRAB or SEEK
+        max_skip (int): Upper bound of the adaptive skip interval
+        smoothing (float): Weight of the previous latency in the moving average
+    """
+
+    def __init__(self, skip_frames=0, target_fps=None, mode=GRAB, max_skip=60, smoothing=0.8):
+        if mode not in (GRAB, SEEK):
+            raise ValueError(f"Unknown sampling mode: {mode}")
+
+        self.skip_frames = skip_frames
+        self.target_fps = target_fps
+        self.mode = mode
+        self.max_skip = max_skip
+        self.smoothing = smoothing
+        self.source_fps = None
+        self.latency = None
+
+    def attach(self, cap):
+        """Reads the frame rate of the source, needed to turn a rate into a skip interval."""
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.source_fps = fps if fps and fps > 0 else None
+
+    def read(self, cap):
+        """Skips `skip_frames` frames without decoding them, then reads the next one."""
+        skip = self.skip_frames
+
+        if skip > 0 and self.mode == SEEK:
+            position = cap.get(cv2.CAP_PROP_POS_FRAMES)
+            if not cap.set(cv2.CAP_PROP_POS_FRAMES, position + skip):
+                return False, None
+        else:
+            for _ in range(skip):
+                if not cap.grab():
+                    return False, None
+
+        return cap.read()
+
+    def update(self, latency):
+        """Feeds the latency of one processed frame (seconds) and adapts the skip interval."""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self.smoothing * self.latency + (1 - self.smoothing) * latency
+
+        if self.target_fps is None or self.source_fps is None:
+            return
+
+        # Sampled frames per second of video: the target rate, or less if inference is slower
+        rate = self.target_fps
+        if self.latency > 0:
+            rate = min(rate, 1 / self.latency)
+
+        skip = int(round(self.source_fps / rate)) - 1
+        self.skip_frames = max(0, min(skip, self.max_skip))
+
+class FramePipeline:
+    """
+    Producer/consumer pipeline for a camera or a video file.
+
+    A capture thread keeps reading frames into a bounded buffer, an inference thread runs `process`
+    on the frames it takes from that buffer and the display stage (the caller's thread, which is the
+    only one allowed to touch the Streamlit UI) reads the results with `read`.
+
+    Args:
+        source: Camera URL, video path or device index passed to cv2.VideoCapture
+        process (callable): Function applied to every captured frame, e.g. a process_frame wrapper
+        capture_size (int): Size of the buffer between capture and inference
+        capture_policy (str): Policy of the capture buffer when inference falls behind
+        result_size (int): Size of the buffer between inference and display
+        result_policy (str): Policy of the result buffer when display falls behind
+        sampler (FrameSampler): Frame skipping of video files, None reads every frame
+    """
+
+    def __init__(self, source, process, capture_size=1, capture_policy=DROP_OLDEST,
+                 result_size=1, result_policy=DROP_OLDEST, sampler=None):
+        self.source = source
+        self.process = process
+        self.sampler = sampler
+        self.frames = FrameBuffer(capture_size, capture_policy)
+        self.results = FrameBuffer(result_size, result_policy)
+        self.frames_read = 0
+        self.error = None
+
+        self._cap = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Opens the source and starts the capture and inference threads."""
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            raise IOError(f"Cannot open video source: {self.source}")
+        if self.sampler is not None:
+            self.sampler.attach(self._cap)
+
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='capture', daemon=True),
+            threading.Thread(target=self._inference_loop, name='inference', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _read_frame(self):
+        if self.sampler is not None:
+            return self.sampler.read(self._cap)
+        return self._cap.read()
+
+    def _capture_loop(self):
+        try:
+            while not self._stop.is_set():
+                ret, frame = self._read_frame()
+                if not ret or frame is None:
+                    break
+                self.frames_read += 1
+                self.frames.put(frame)
+        except Exception as e:
+            self.error = e
+        finally:
+            # Let the inference thread drain what is left and then finish
+            self.frames.close()
+
+    def _inference_loop(self):
+        try:
+            while not self._stop.is_set():
+                frame = self.frames.get()
+                if frame is None:
+                    break
+
+                start_time = time.perf_counter()
+                result = self.process(frame)
+                if self.sampler is not None:
+                    self.sampler.update(time.perf_counter() - start_time)
+
+                self.results.put((frame, result))
+        except Exception as e:
+            self.error = e
+        finally:
+            self.results.close()
+
+    def read(self, timeout=None):
+        """
+        Returns the next (frame, result) pair for display.
+
+        Returns None once the source is exhausted (or the timeout expired), check `running` to
+        tell both cases apart.
+        """
+        return self.results.get(timeout)
+
+    @property
+    def running(self):
+        return not self.results.closed or len(self.results) > 0
+
+    def stop(self):
+        """Stops both threads and releases the video source."""
+        self._stop.set()
+        self.frames.close()
+        self.results.close()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        if self._cap is not None:
+            self._cap.release()
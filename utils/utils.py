@@ -2,12 +2,17 @@ import os
 import shutil
 import tqdm
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import torch
 import numpy as np
 import cv2
 from PIL import Image, ImageDraw
 
+from .profiling import pipeline_timer
+from .metrics import metrics_registry
+
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
 # Define the character set for license plates
@@ -22,6 +27,9 @@ DECODE_PLATE = {
     35: 'Z'
 }
 
+# Lookup array decoding a class id to its character
+DECODE_LUT = np.array([DECODE_PLATE[i] for i in range(len(DECODE_PLATE))])
+
 def read_yolo_label_file(label_path):
     """
     Reads a YOLO label file and returns the bounding box coordinates and class ids.
@@ -130,87 +138,162 @@ def read_plate_characters(label_path):
 
     return characters
 
-def copy_matching_images(image_folder, label_filenames, destination_folder):
-    # Get all image files in the image_folder
-    image_filenames = [f for f in os.listdir(image_folder) if f.endswith(('.jpg', '.png'))]
-    
-    # Copy images that have a corresponding filename in the tex_label folder
-    for image in image_filenames:
-        image_name = os.path.splitext(image)[0]
-        if image_name in label_filenames:
-            shutil.copy(os.path.join(image_folder, image), os.path.join(destination_folder, image))
-            print(f"Copied {image} to {destination_folder}")
-
-def crop_images_with_labels(image_folder, label_folder, tex_label_folder, output_folder):
-    # Create output folder if it doesn't exist
-    os.makedirs(output_folder, exist_ok=True)
+def index_folder(folder, extensions):
+    """
+    Lists a folder once and indexes its files by name without extension.
 
-    # Get list of label files in the tex_label folder
-    tex_label_files = [f for f in os.listdir(tex_label_folder) if f.endswith('.txt')]
+    Args:
+        folder (str): Folder to index
+        extensions (tuple): Extensions of the files to keep, e.g. ('.jpg', '.png')
 
-    for tex_label_file in tqdm.tqdm(tex_label_files):
-        # Get the base name without extension
-        base_name = os.path.splitext(tex_label_file)[0]
+    Returns:
+        index (dict): base_name -> (path, modification time)
+    """
+    index = {}
+    if not os.path.isdir(folder):
+        return index
+
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(extensions):
+                index[os.path.splitext(entry.name)[0]] = (entry.path, entry.stat().st_mtime)
+    return index
+
+def is_up_to_date(output_index, output_name, *input_mtimes):
+    """Tells whether an output of an index is at least as recent as all its inputs."""
+    output = output_index.get(output_name)
+    return output is not None and output[1] >= max(input_mtimes)
+
+def copy_matching_images(image_folder, label_filenames, destination_folder, workers=8):
+    # Index the images once, the label names are looked up in a set
+    image_index = index_folder(image_folder, ('.jpg', '.png'))
+    destination_index = index_folder(destination_folder, ('.jpg', '.png'))
+    label_filenames = set(label_filenames)
+
+    # Copy images that have a corresponding filename in the tex_label folder, unless already copied
+    jobs = []
+    for image_name, (image_path, image_mtime) in image_index.items():
+        if image_name in label_filenames and not is_up_to_date(destination_index, image_name, image_mtime):
+            jobs.append((image_path, os.path.join(destination_folder, os.path.basename(image_path))))
+
+    # Copying is I/O bound, threads are enough
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(tqdm.tqdm(executor.map(lambda job: shutil.copy2(*job), jobs), total=len(jobs)))
+
+    print(f"Copied {len(jobs)} images to {destination_folder}")
+
+def crop_image_with_labels(base_name, image_path, label_path, text_label_path, output_folder):
+    """
+    Crops every labeled license plate of one image, one output image and text label per box.
 
-        # Construct paths
-        image_path = os.path.join(image_folder, base_name + '.jpg')
-        label_path = os.path.join(label_folder, base_name + '.txt')
-        text_label_path = os.path.join(tex_label_folder, tex_label_file)
+    The first box is saved as base_name.jpg, the next ones as base_name_1.jpg, base_name_2.jpg...
+    base_name.jpg is written last so that its presence means the image is fully processed. Crops an
+    earlier run wrote for boxes the label no longer has are removed.
 
-        # Check if the image and label files exist
-        if os.path.exists(image_path) and os.path.exists(label_path):
-            # Read the bounding box coordinates from the label file
-            labels = read_yolo_label_file(label_path)
+    Returns:
+        crops (int): Number of crops written, -1 if the image could not be read and was removed
+    """
+    # Read the bounding box coordinates from the label file
+    labels = read_yolo_label_file(label_path)
+
+    # Remove the outputs of the boxes beyond the current label, left by an earlier run
+    i = len(labels)
+    while True:
+        stale_name = base_name if i == 0 else f"{base_name}_{i}"
+        stale_paths = [os.path.join(output_folder, stale_name + extension) for extension in ('.jpg', '.txt')]
+        stale_paths = [path for path in stale_paths if os.path.exists(path)]
+        if not stale_paths:
+            break
+        for path in stale_paths:
+            os.remove(path)
+        i += 1
 
-            # Open the image
-            try:
-                image = Image.open(image_path)
-                img_width, img_height = image.size
+    # Open the image
+    try:
+        image = Image.open(image_path)
+        image.load()
+    except OSError:
+        os.remove(image_path)
+        return -1
 
-                for label in labels:
-                    x_center, y_center, width, height = label['x_center'], label['y_center'], label['width'], label['height']
-                    x_min, y_min, x_max, y_max = yolo_to_bbox(x_center, y_center, width, height, img_width, img_height)
+    img_width, img_height = image.size
+    for i in reversed(range(len(labels))):
+        label = labels[i]
+        x_center, y_center, width, height = label['x_center'], label['y_center'], label['width'], label['height']
+        x_min, y_min, x_max, y_max = yolo_to_bbox(x_center, y_center, width, height, img_width, img_height)
 
-                    # Crop the image using the bounding box coordinates
-                    cropped_image = image.crop((x_min, y_min, x_max, y_max))
+        # Crop the image using the bounding box coordinates and save it with its text label
+        output_name = base_name if i == 0 else f"{base_name}_{i}"
+        shutil.copy(text_label_path, os.path.join(output_folder, output_name + '.txt'))
+        image.crop((x_min, y_min, x_max, y_max)).convert('RGB').save(os.path.join(output_folder, output_name + '.jpg'))
 
-                    # Save the cropped image
-                    cropped_image_path = os.path.join(output_folder, base_name + '.jpg')
-                    cropped_image.save(cropped_image_path)
+    return len(labels)
 
-                    shutil.copy(text_label_path, os.path.join(output_folder, base_name + '.txt'))
-            except:
-                os.remove(image_path)
+def crop_images_with_labels(image_folder, label_folder, tex_label_folder, output_folder, workers=None):
+    # Create output folder if it doesn't exist
+    os.makedirs(output_folder, exist_ok=True)
 
-def organize_tex_label_folder(image_folder, label_folder, tex_label_folder):
+    # Index every folder once instead of checking each file
+    image_index = index_folder(image_folder, ('.jpg',))
+    label_index = index_folder(label_folder, ('.txt',))
+    tex_label_index = index_folder(tex_label_folder, ('.txt',))
+    output_index = index_folder(output_folder, ('.jpg',))
+
+    # Keep the images with both labels whose crops are missing or older than their inputs
+    jobs = []
+    for base_name, (text_label_path, text_label_mtime) in tex_label_index.items():
+        if base_name not in image_index or base_name not in label_index:
+            continue
+        image_path, image_mtime = image_index[base_name]
+        label_path, label_mtime = label_index[base_name]
+        if not is_up_to_date(output_index, base_name, image_mtime, label_mtime, text_label_mtime):
+            jobs.append((base_name, image_path, label_path, text_label_path))
+
+    print(f"{len(jobs)} images to crop, {len(tex_label_index) - len(jobs)} skipped")
+    if not jobs:
+        return
+
+    # Decoding, cropping and encoding are CPU bound, spread them over processes
+    base_names, image_paths, label_paths, text_label_paths = zip(*jobs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(crop_image_with_labels, base_names, image_paths, label_paths, text_label_paths,
+                               [output_folder] * len(jobs), chunksize=32)
+        crops = list(tqdm.tqdm(results, total=len(jobs)))
+
+    removed = sum(1 for count in crops if count < 0)
+    print(f"Wrote {sum(count for count in crops if count > 0)} crops, removed {removed} unreadable images")
+
+def organize_tex_label_folder(image_folder, label_folder, tex_label_folder, workers=8):
     # Create tex_label folder if it doesn't exist
     os.makedirs(tex_label_folder, exist_ok=True)
 
+    # Index the folders once
+    image_index = index_folder(image_folder, ('.jpg',))
+    label_index = index_folder(label_folder, ('.txt',))
+    tex_label_index = index_folder(tex_label_folder, ('.jpg',))
+
     # Create a single labels.txt file
     labels_txt_path = os.path.join(tex_label_folder, 'labels.txt')
+    copies = []
     with open(labels_txt_path, 'w') as labels_txt:
-        # Get list of label files in the label folder
-        label_files = [f for f in os.listdir(label_folder) if f.endswith('.txt')]
+        for base_name in sorted(label_index):
+            if base_name not in image_index:
+                continue
 
-        for label_file in label_files:
-            # Get the base name without extension
-            base_name = os.path.splitext(label_file)[0]
+            image_path, image_mtime = image_index[base_name]
+            label_path, _ = label_index[base_name]
 
-            # Construct paths
-            image_path = os.path.join(image_folder, base_name + '.jpg')
-            label_path = os.path.join(label_folder, label_file)
+            # Copy the image to the tex_label folder unless it is already there
+            if not is_up_to_date(tex_label_index, base_name, image_mtime):
+                copies.append((image_path, tex_label_folder))
 
-            # Check if the image and label files exist
-            if os.path.exists(image_path) and os.path.exists(label_path):
-                # Move the image to the tex_label folder
-                shutil.copy(image_path, tex_label_folder)
+            # Read the label file and write to labels.txt
+            labels_txt.write(f"{base_name}.jpg {read_label(label_path)}\n")
 
-                # Read the label file and write to labels.txt
-                with open(label_path, 'r') as lf:
-                    label = lf.readline().strip()
-                    labels_txt.write(f"{base_name}.jpg {label}\n")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda job: shutil.copy2(*job), copies))
 
-    print(f"Organized tex_label folder and created {labels_txt_path}")
+    print(f"Organized tex_label folder ({len(copies)} images copied) and created {labels_txt_path}")
 
 def read_image(image_path):
     """Read an image from a file and return it as a numpy array."""
@@ -223,48 +306,131 @@ def read_label(label_path):
         label = file.readline().strip()
     return label
 
-# Define a function to sort bounding boxes top-to-down, left-to-right
-def sort_boxes_top_to_down_left_to_right(boxes, classes):
-    # Step 1: Sort by the `y_min` (top edge of bounding box) to get top-to-down order
-    sorted_indices = np.argsort(boxes[:, 1])  # Sort by `y_min` (index 1)
-    boxes = boxes[sorted_indices]
-    classes = classes[sorted_indices]
-    
-    # Step 2: Within each row (roughly same y_min), sort by `x_min` (left edge of bounding box)
-    sorted_boxes = []
-    sorted_classes = []
-    
-    # Define a threshold to consider "rows" (adjust based on your images)
-    row_threshold = 0.1 * (np.max(boxes[:, 3]) - np.min(boxes[:, 1]))  # 10% of plate height
-    
-    current_row = []
-    current_classes = []
-    
-    last_y_min = boxes[0][1]
-    
-    for i, box in enumerate(boxes):
-        if abs(box[1] - last_y_min) > row_threshold:  # Start a new row
-            # Sort the current row by `x_min` (left edge of bounding box)
-            sorted_row_indices = np.argsort(np.array(current_row)[:, 0])
-            sorted_boxes.extend(np.array(current_row)[sorted_row_indices])
-            sorted_classes.extend(np.array(current_classes)[sorted_row_indices])
-            
-            # Reset for the new row
-            current_row = [box]
-            current_classes = [classes[i]]
-            last_y_min = box[1]
-        else:
-            # Add to the current row
-            current_row.append(box)
-            current_classes.append(classes[i])
-    
-    # Sort the last row
-    sorted_row_indices = np.argsort(np.array(current_row)[:, 0])
-    sorted_boxes.extend(np.array(current_row)[sorted_row_indices])
-    sorted_classes.extend(np.array(current_classes)[sorted_row_indices])
-    
+# Function to order the characters of a batch of plates top-to-down, left-to-right
+def order_boxes_batch(boxes, lengths, row_factor=0.5):
+    """
+    Computes the reading order of the characters of several plates at once.
+
+    Characters are clustered into rows by their vertical centers: a new row starts wherever the
+    gap between two consecutive centers exceeds `row_factor` times the median character height of
+    the plate. Rows are read top to down and each row left to right.
+
+    Args:
+        boxes (np.ndarray): (B, N, 4) character boxes (x_min, y_min, x_max, y_max), padded to N
+        lengths (np.ndarray): (B,) number of valid boxes of each plate
+        row_factor (float): Fraction of the character height separating two rows
+
+    Returns:
+        order (np.ndarray): (B, N) indices into the boxes of each plate, padding comes last
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    lengths = np.asarray(lengths)
+    num_plates, max_length = boxes.shape[:2]
+    if max_length == 0:
+        return np.zeros((num_plates, 0), dtype=np.int64)
+
+    valid = np.arange(max_length)[None, :] < lengths[:, None]
+
+    # Row threshold from the median character height of every plate. The padding is sorted last,
+    # which is much cheaper than np.nanmedian on small plates
+    heights = np.sort(np.where(valid, boxes[..., 3] - boxes[..., 1], np.inf), axis=1)
+    lower = np.take_along_axis(heights, np.maximum(lengths - 1, 0)[:, None] // 2, axis=1)[:, 0]
+    upper = np.take_along_axis(heights, np.minimum(lengths // 2, max_length - 1)[:, None], axis=1)[:, 0]
+    row_threshold = np.where(lengths > 0, row_factor * (lower + upper) / 2, 0)
+
+    # Sort the vertical centers and start a new row at every large gap
+    y_centers = np.where(valid, (boxes[..., 1] + boxes[..., 3]) / 2, np.inf)
+    by_y = np.argsort(y_centers, axis=1, kind='stable')
+    sorted_y = np.take_along_axis(y_centers, by_y, axis=1)
+    with np.errstate(invalid='ignore'):
+        new_row = np.diff(sorted_y, axis=1) > row_threshold[:, None]
+    sorted_rows = np.concatenate([np.zeros((num_plates, 1), dtype=np.int64), np.cumsum(new_row, axis=1)], axis=1)
+
+    rows = np.empty_like(sorted_rows)
+    np.put_along_axis(rows, by_y, sorted_rows, axis=1)
+    rows = np.where(valid, rows, max_length)  # Padding goes after the last row
+
+    # Order by row, then by left edge inside the row
+    x_min = np.where(valid, boxes[..., 0], np.inf)
+    return np.lexsort((x_min, rows), axis=-1)
+
+# Function to sort the character boxes of a batch of plates
+def sort_boxes_batch(boxes, classes, lengths, row_factor=0.5):
+    """
+    Sorts the character boxes and classes of several plates top-to-down, left-to-right.
+
+    Args:
+        boxes (np.ndarray): (B, N, 4) character boxes, padded to N
+        classes (np.ndarray): (B, N) character classes, padded to N
+        lengths (np.ndarray): (B,) number of valid boxes of each plate
+        row_factor (float): Fraction of the character height separating two rows
+
+    Returns:
+        sorted_boxes (np.ndarray): (B, N, 4) sorted boxes, padding stays at the end
+        sorted_classes (np.ndarray): (B, N) sorted classes, padding stays at the end
+    """
+    boxes = np.asarray(boxes)
+    classes = np.asarray(classes)
+    order = order_boxes_batch(boxes, lengths, row_factor)
+
+    sorted_boxes = np.take_along_axis(boxes, order[..., None], axis=1)
+    sorted_classes = np.take_along_axis(classes, order, axis=1)
     return sorted_boxes, sorted_classes
 
+# Define a function to sort bounding boxes top-to-down, left-to-right
+def sort_boxes_top_to_down_left_to_right(boxes, classes, row_factor=0.5):
+    """
+    Sorts the character boxes and classes of one plate top-to-down, left-to-right.
+
+    Args:
+        boxes (np.ndarray): (N, 4) character boxes (x_min, y_min, x_max, y_max)
+        classes (np.ndarray): (N,) character classes
+        row_factor (float): Fraction of the character height separating two rows
+
+    Returns:
+        sorted_boxes (np.ndarray): (N, 4) sorted boxes
+        sorted_classes (np.ndarray): (N,) sorted classes
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    classes = np.asarray(classes).reshape(-1)
+    if len(boxes) == 0:
+        return boxes, classes
+
+    # Same ordering as order_boxes_batch, without the padding and the batch indexing that only
+    # pay off over several plates
+    coordinates = boxes.astype(np.float32, copy=False)
+    heights = np.sort(coordinates[:, 3] - coordinates[:, 1])
+    row_threshold = row_factor * (heights[(len(heights) - 1) // 2] + heights[len(heights) // 2]) / 2
+
+    y_centers = (coordinates[:, 1] + coordinates[:, 3]) / 2
+    by_y = np.argsort(y_centers, kind='stable')
+    rows = np.empty(len(boxes), dtype=np.int64)
+    rows[by_y] = np.concatenate(([0], np.cumsum(np.diff(y_centers[by_y]) > row_threshold)))
+
+    order = np.lexsort((coordinates[:, 0], rows))
+    return boxes[order], classes[order]
+
+# Function to decode character classes into the plate text
+def decode_plate_classes(classes):
+    """Decodes a sequence of character classes into a string through DECODE_LUT."""
+    return ''.join(DECODE_LUT[np.asarray(classes, dtype=np.int64)])
+
+# Function to decode the sorted character classes of a batch of plates
+def decode_plate_batch(classes, lengths):
+    """
+    Decodes padded character classes into one string per plate.
+
+    Args:
+        classes (np.ndarray): (B, N) sorted character classes, padded to N
+        lengths (np.ndarray): (B,) number of valid characters of each plate
+
+    Returns:
+        texts (list): The text of every plate
+    """
+    classes = np.asarray(classes, dtype=np.int64)
+    characters = DECODE_LUT[np.clip(classes, 0, len(DECODE_LUT) - 1)]
+    return [''.join(row[:length]) for row, length in zip(characters, lengths)]
+
 # Function to smooth the bounding box coordinates
 def smooth_boxes(current_boxes, prev_boxes, smoothing_factor):
     if len(prev_boxes) == 0:
@@ -277,57 +443,441 @@ def smooth_boxes(current_boxes, prev_boxes, smoothing_factor):
 
     return np.array(smoothed_boxes)
 
-# Function to process frames for license plate detection and recognition
-def process_frame(frame, detector, recognizer, smoothing_factor=0.8, prev_boxes = []):
-    start_time = time.time()
-    # Detect the license plates using the first YOLO model
-    detection_results = detector(frame, verbose=False, conf=0.4, device=device)[0]
-    current_boxes = detection_results.boxes.xyxy.cpu().numpy()
-
-    # Smooth the bounding boxes with temporal smoothing
-    if len(prev_boxes) > 0:
-        current_boxes = smooth_boxes(current_boxes, prev_boxes, smoothing_factor)
-
-    # Update previous bounding boxes
-    prev_boxes = current_boxes
-    plate_text = ""
-
-    for result in current_boxes:
-        # Get the bounding box coordinates for each detected license plate
-        x1, y1, x2, y2 = map(int, result[:4])  # Ensure coordinates are integers
-
-        # Crop the license plate region from the frame
-        plate = frame[y1:y2, x1:x2]
-
-        # Recognize the license plate characters using the second YOLO model
-        recog_results = recognizer(plate, verbose=False, device=device)[0]
-        recog_boxes = recog_results.boxes.xyxy.cpu()  # Bounding boxes for characters
-        recog_classes = recog_results.boxes.cls.cpu()  # Character classes
-
-        if len(recog_boxes) > 0:
-            # Sort characters from top to down and left to right
-            sorted_boxes, sorted_classes = sort_boxes_top_to_down_left_to_right(
-                np.array(recog_boxes), np.array(recog_classes)
-            )
-
-            # Decode the plate text
-            plate_text = ''.join([DECODE_PLATE[int(cls)] for cls in sorted_classes])
+# Function to compute the IoU between two sets of boxes
+def box_iou(boxes_a, boxes_b):
+    """
+    Computes the pairwise intersection over union of two sets of boxes.
+
+    Args:
+        boxes_a (np.ndarray): (N, 4) boxes as (x_min, y_min, x_max, y_max)
+        boxes_b (np.ndarray): (M, 4) boxes as (x_min, y_min, x_max, y_max)
+
+    Returns:
+        iou (np.ndarray): (N, M) matrix of IoU values
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    return intersection / np.maximum(union, 1e-6)
+
+class PlateTrack:
+    """
+    A license plate followed across frames, its text is the vote of the recent recognitions.
+
+    Args:
+        track_id (int): Unique id of the track
+        box (np.ndarray): First (x_min, y_min, x_max, y_max) box of the plate
+        max_votes (int): Number of recent recognitions taking part in the vote
+    """
+
+    def __init__(self, track_id, box, max_votes=15):
+        self.track_id = track_id
+        self.box = np.asarray(box[:4], dtype=np.float32)
+        self.missed = 0
+        self.age = 0
+        self.frames_since_recognition = 0
+        self.recognitions = 0
+        self.votes = deque(maxlen=max_votes)
+
+    def vote(self, text, confidence):
+        """Adds the result of one recognition of the plate."""
+        self.recognitions += 1
+        self.frames_since_recognition = 0
+        if text:
+            self.votes.append((text, confidence))
+
+    @property
+    def text(self):
+        """Text with the highest summed confidence among the recent recognitions."""
+        return self._best()[0]
+
+    @property
+    def confidence(self):
+        """Mean recognition confidence of the winning text, 0 if the plate was never read."""
+        return self._best()[1]
+
+    def _best(self):
+        if not self.votes:
+            return "", 0.0
+
+        scores = {}
+        counts = {}
+        for text, confidence in self.votes:
+            scores[text] = scores.get(text, 0.0) + confidence
+            counts[text] = counts.get(text, 0) + 1
+
+        best = max(scores, key=scores.get)
+        return best, scores[best] / counts[best]
+
+class PlateTracker:
+    """
+    Lightweight IoU tracker for license plates.
+
+    Detections are greedily matched to the existing tracks by IoU, matched boxes are temporally
+    smoothed and the recognizer only has to run on tracks that are new, have a low confidence or
+    are due for a refresh.
+
+    Args:
+        iou_threshold (float): Minimum IoU to associate a detection with a track
+        max_missed (int): Number of frames a track survives without detection
+        min_confidence (float): Tracks below this confidence are recognized again on the next frame
+        refresh_interval (int): Confident tracks are recognized again every `refresh_interval` frames
+        smoothing_factor (float): Weight of the previous box in the temporal smoothing
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, min_confidence=0.6, refresh_interval=15,
+                 smoothing_factor=0.8):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_confidence = min_confidence
+        self.refresh_interval = refresh_interval
+        self.smoothing_factor = smoothing_factor
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, boxes):
+        """
+        Associates the detections of a new frame with the tracks.
+
+        Args:
+            boxes (np.ndarray): (N, 4) detected boxes
+
+        Returns:
+            tracks (list): The track of every detection, in detection order
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        assigned = [None] * len(boxes)
+        matched = set()
+
+        if self.tracks and len(boxes):
+            iou = box_iou(boxes, np.array([track.box for track in self.tracks]))
+
+            # Greedy matching, best IoU first
+            for flat_index in np.argsort(-iou, axis=None):
+                box_index, track_index = np.unravel_index(flat_index, iou.shape)
+                if iou[box_index, track_index] < self.iou_threshold:
+                    break
+                if assigned[box_index] is not None or track_index in matched:
+                    continue
+
+                track = self.tracks[track_index]
+                track.box = smooth_boxes(boxes[box_index:box_index + 1], track.box[None], self.smoothing_factor)[0]
+                assigned[box_index] = track
+                matched.add(track_index)
+
+        # Age the tracks and forget the ones that were not seen for too long
+        for track_index, track in enumerate(self.tracks):
+            track.missed = 0 if track_index in matched else track.missed + 1
+            track.age += 1
+            track.frames_since_recognition += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        # Unmatched detections start new tracks
+        for box_index, track in enumerate(assigned):
+            if track is None:
+                track = PlateTrack(self._next_id, boxes[box_index])
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[box_index] = track
+
+        return assigned
+
+    def needs_recognition(self, track):
+        """Tells whether the recognizer has to run on the plate of a track in this frame."""
+        return (track.recognitions == 0
+                or track.confidence < self.min_confidence
+                or track.frames_since_recognition >= self.refresh_interval)
+
+    def reset(self):
+        self.tracks = []
+
+# Function to shrink a frame so that its longest side fits in max_size
+def resize_to_fit(frame, max_size):
+    """
+    Returns the frame downscaled so that its longest side is at most `max_size` pixels.
+
+    Returns:
+        resized (np.ndarray): Downscaled frame, the frame itself if it already fits
+        scale (float): Size of the resized frame relative to the original one
+    """
+    height, width = frame.shape[:2]
+    if not max_size or max(height, width) <= max_size:
+        return frame, 1.0
+    scale = max_size / max(height, width)
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+# Function to crop the detected license plates out of a frame
+def crop_plates(frame, boxes):
+    """
+    Crops every detected license plate out of a frame.
+
+    Args:
+        frame (np.ndarray): Frame the boxes were detected on
+        boxes (np.ndarray): Plate boxes as an (N, 4) array of (x_min, y_min, x_max, y_max)
+
+    Returns:
+        plates (list): Cropped plate images, one per box
+        coords (list): Integer pixel coordinates (x1, y1, x2, y2) of each crop
+    """
+    frame_height, frame_width = frame.shape[:2]
+    plates = []
+    coords = []
+
+    for box in boxes:
+        # Clip the box to the frame so the crop is never out of bounds
+        x1, y1, x2, y2 = map(int, box[:4])
+        x1, x2 = max(0, min(x1, frame_width)), max(0, min(x2, frame_width))
+        y1, y2 = max(0, min(y1, frame_height)), max(0, min(y2, frame_height))
+
+        plates.append(frame[y1:y2, x1:x2])
+        coords.append((x1, y1, x2, y2))
+
+    return plates, coords
+
+# Function to decode the recognizer results into the plate texts
+def decode_plate_results(recog_results):
+    """
+    Decodes the characters found by the recognizer on several plates at once.
+
+    Args:
+        recog_results (list): Ultralytics results of the character recognizer, one per plate
+
+    Returns:
+        texts (list): (plate_text, confidence) of every plate, the text is ordered top-to-down,
+            left-to-right and the confidence is the mean confidence of its characters
+    """
+    recog_boxes = [result.boxes.xyxy.cpu().numpy() for result in recog_results]  # Bounding boxes for characters
+    recog_classes = [result.boxes.cls.cpu().numpy() for result in recog_results]  # Character classes
+    recog_conf = [result.boxes.conf.cpu().numpy() for result in recog_results]  # Character confidences
+
+    return decode_plate_arrays(recog_boxes, recog_classes, recog_conf)
+
+# Function to decode the raw character boxes of several plates
+def decode_plate_arrays(recog_boxes, recog_classes, recog_conf):
+    """
+    Orders and decodes the characters of several plates from raw arrays, e.g. cached predictions.
+
+    Args:
+        recog_boxes (list): (K, 4) xyxy character boxes of every plate
+        recog_classes (list): (K,) character classes of every plate
+        recog_conf (list): (K,) character confidences of every plate
+
+    Returns:
+        texts (list): (plate_text, confidence) of every plate, see decode_plate_results
+    """
+    # Pad every plate to the same number of characters
+    lengths = np.array([len(boxes) for boxes in recog_boxes])
+    max_length = int(lengths.max()) if len(lengths) else 0
+    boxes = np.zeros((len(recog_boxes), max_length, 4), dtype=np.float32)
+    classes = np.zeros((len(recog_boxes), max_length), dtype=np.int64)
+    for i, length in enumerate(lengths):
+        boxes[i, :length] = recog_boxes[i]
+        classes[i, :length] = recog_classes[i]
+
+    # Sort characters from top to down and left to right, then decode the plate texts
+    sorted_boxes, sorted_classes = sort_boxes_batch(boxes, classes, lengths)
+    plate_texts = decode_plate_batch(sorted_classes, lengths)
+
+    return [
+        (plate_text, float(conf.mean()) if len(conf) else 0.0)
+        for plate_text, conf in zip(plate_texts, recog_conf)
+    ]
+
+# Function to recognize a batch of license plates with one recognizer call
+def read_plate_texts(plates, recognizer, timer=pipeline_timer, recognition_cache=None):
+    """
+    Recognizes the characters of several plate crops in a single batched call.
+
+    Args:
+        plates (list): Cropped plate images
+        recognizer: Character recognition YOLO model
+        timer (StageTimer): Records the 'cache', 'recognize' and 'decode' stages
+        recognition_cache (RecognitionCache): Optional cache, crops matching an already read
+            plate are not sent to the recognizer
+
+    Returns:
+        texts (list): (plate_text, confidence) for every crop, in input order
+    """
+    texts = [("", 0.0)] * len(plates)
+
+    # Empty crops (degenerate boxes) cannot be fed to the model
+    valid = [i for i, plate in enumerate(plates) if plate.size > 0]
+
+    # The same car often stays in front of the barrier, only unknown crops are recognized
+    signatures = {}
+    if recognition_cache is not None and valid:
+        with timer.stage('cache'):
+            missing = []
+            for i in valid:
+                signatures[i] = recognition_cache.signature(plates[i])
+                cached = recognition_cache.get(signatures[i])
+                if cached is None:
+                    missing.append(i)
+                else:
+                    texts[i] = cached
+            valid = missing
+
+    if not valid:
+        return texts
+
+    # The recognizer letterboxes all crops to the same size and runs them as one batch
+    with timer.stage('recognize'):
+        recog_results = recognizer([plates[i] for i in valid], verbose=False, device=device)
+    metrics_registry.inc('lp_recognizer_calls_total')
+    metrics_registry.inc('lp_recognized_plates_total', len(valid))
+
+    with timer.stage('decode'):
+        for i, text in zip(valid, decode_plate_results(recog_results)):
+            texts[i] = text
+            if i in signatures:
+                recognition_cache.put(signatures[i], *text)
+
+    return texts
+
+# Function to detect and recognize every license plate in a frame
+def recognize_plates(frame, detector, recognizer, tracker=None, timer=pipeline_timer, detect_size=None,
+                     recognition_cache=None):
+    """
+    Detects the license plates in a frame and recognizes all of them in one batch.
+
+    Args:
+        frame (np.ndarray): BGR frame
+        detector: License plate detection YOLO model
+        recognizer: Character recognition YOLO model
+        tracker (PlateTracker): Optional tracker, only the plates it asks for are recognized and
+            the returned text is the vote of the track
+        timer (StageTimer): Records the 'detect', 'crop', 'recognize' and 'decode' stages
+        detect_size (int): Longest side of the copy the detector runs on, None for the full frame.
+            The plates are still cropped from the full resolution frame.
+        recognition_cache (RecognitionCache): Optional cache of the plates already read
+
+    Returns:
+        plates (list): One dictionary per detected plate with 'box', 'text', 'confidence' and 'track_id'
+    """
+    return recognize_plates_batch([frame], detector, recognizer, [tracker], timer, detect_size, recognition_cache)[0]
+
+# Function to detect and recognize the license plates of frames from several streams at once
+def recognize_plates_batch(frames, detector, recognizer, trackers=None, timer=pipeline_timer, detect_size=None,
+                           recognition_cache=None):
+    """
+    Detects the license plates of several frames with one detector call, then recognizes the
+    plates of all of them with one recognizer call.
+
+    Args:
+        frames (list): BGR frames, e.g. the latest frame of every camera
+        detector: License plate detection YOLO model
+        recognizer: Character recognition YOLO model
+        trackers (list): Optional PlateTracker (or None) of the stream of every frame
+        timer (StageTimer): Records the 'detect', 'crop', 'recognize' and 'decode' stages
+        detect_size (int): Longest side of the copies the detector runs on, None for the full frames
+        recognition_cache (RecognitionCache): Optional cache shared by the streams
+
+    Returns:
+        plates (list): For every frame, the list returned by recognize_plates
+    """
+    if not frames:
+        return []
+    trackers = trackers or [None] * len(frames)
+
+    # Detect the license plates of every frame using the first YOLO model, on downscaled copies.
+    # The boxes are scaled back so that the plates are cropped at full resolution for the OCR.
+    with timer.stage('detect'):
+        resized = [resize_to_fit(frame, detect_size) for frame in frames]
+        detection_results = detector([small for small, _ in resized], verbose=False, conf=0.4, device=device)
+        frame_boxes = [result.boxes.xyxy.cpu().numpy() / scale for result, (_, scale) in zip(detection_results, resized)]
+
+    # Crop all plates from the raw detections
+    with timer.stage('crop'):
+        frame_crops = [crop_plates(frame, boxes) for frame, boxes in zip(frames, frame_boxes)]
+
+    # Pick the crops to recognize: all of them, or only the new, uncertain or stale tracks
+    frame_tracks, pending = [], []
+    for f, (tracker, boxes) in enumerate(zip(trackers, frame_boxes)):
+        if tracker is None:
+            frame_tracks.append(None)
+            pending.extend((f, i) for i in range(len(boxes)))
         else:
-            plate_text = ""
+            tracks = tracker.update(boxes)
+            frame_tracks.append(tracks)
+            pending.extend((f, i) for i, track in enumerate(tracks) if tracker.needs_recognition(track))
+
+    # Recognize the plates of all frames together using the second YOLO model
+    texts = read_plate_texts([frame_crops[f][0][i] for f, i in pending], recognizer, timer, recognition_cache)
+
+    results = [[None] * len(crops) for crops, _ in frame_crops]
+    for (f, i), (text, confidence) in zip(pending, texts):
+        if frame_tracks[f] is None:
+            results[f][i] = {'box': frame_crops[f][1][i], 'text': text, 'confidence': confidence, 'track_id': None}
+        else:
+            frame_tracks[f][i].vote(text, confidence)
+
+    for f, tracks in enumerate(frame_tracks):
+        if tracks is not None:
+            results[f] = [
+                {'box': tuple(map(int, track.box)), 'text': track.text, 'confidence': track.confidence,
+                 'track_id': track.track_id}
+                for track in tracks
+            ]
+
+    return results
+
+# Function to draw the recognized license plates on a frame, scale maps the boxes to a resized frame
+def draw_plates(frame, plates, scale=1.0):
+    for plate in plates:
+        x1, y1, x2, y2 = (int(v * scale) for v in plate['box'])
+        plate_text = plate['text'].strip()
 
         # If text is detected
-        if len(plate_text.strip()) > 0:
+        if len(plate_text) > 0:
             # Draw the bounding box around the detected license plate
             cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
             # Draw the recognized text above the bounding box
-            cv2.putText(frame, plate_text.strip(), (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-
-    # Calculate the processing time
-    end_time = time.time()
-    fps_display = int(1 / (end_time - start_time))
+            cv2.putText(frame, plate_text, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
 
-    # Display the processing time on the frame
-    cv2.putText(frame, f"FPS: {fps_display}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+    return frame
 
-    return frame, plate_text
\ No newline at end of file
+# Function to process frames for license plate detection and recognition
+def process_frame(frame, detector, recognizer, tracker=None, timer=pipeline_timer, gate=None, detect_size=None,
+                  annotate=True, recognition_cache=None):
+    start_time = time.perf_counter()
+
+    # A MotionGate skips the detector while the scene is static, the last plates are kept
+    detect = True
+    if gate is not None:
+        with timer.stage('gate'):
+            detect = gate.check(frame)
+
+    if detect:
+        # Detect and recognize every plate of the frame, recognition is batched across plates.
+        # With a tracker the boxes are temporally smoothed and the text is voted across frames.
+        plates = recognize_plates(frame, detector, recognizer, tracker, timer, detect_size, recognition_cache)
+        metrics_registry.observe('lp_detections_per_frame', len(plates))
+        if gate is not None:
+            gate.plates = plates
+    else:
+        plates = gate.plates
+
+    # The text of the last plate is kept for the single plate callers
+    plate_text = plates[-1]['text'] if plates else ""
+
+    # Callers rendering a preview of their own draw on it instead of the full resolution frame
+    if annotate:
+        with timer.stage('annotate'):
+            draw_plates(frame, plates)
+
+            # Display the rolling processing rate on the frame
+            cv2.putText(frame, f"FPS: {timer.fps('frame'):.1f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+    timer.record('frame', time.perf_counter() - start_time)
+
+    return frame, plate_text, plates